@@ -0,0 +1,80 @@
+import datetime as dt
+import importlib
+from flask import Blueprint, Response, render_template, request, session, make_response, current_app, stream_with_context
+from flask_login import login_required, current_user
+from authorize import role_required
+from figure_cache import combine_etags
+import profiling
+
+
+analytics_bp = Blueprint('analytics', __name__)
+
+
+def profiled(builder, *args):
+    # Figure building (DataFrame + Plotly + to_json) shows up as its own Server-Timing entry
+    def build():
+        with profiling.track('figures'):
+            return builder(*args)
+    return build
+
+
+def analytics_figures():
+    # pandas and plotly are imported here, on the first dashboard request, instead of at worker startup
+    return importlib.import_module('analytics_figures')
+
+
+def revenue_start_date(figures_module, revenue_range):
+    days = figures_module.REVENUE_RANGES[revenue_range]
+    return dt.date.today() - dt.timedelta(days=days) if days else None
+
+
+@analytics_bp.route('/analytics-dashboard')
+@login_required
+@role_required(['ADMIN'])
+def analytics_dashboard():
+    figure_cache = current_app.extensions['figure_cache']
+    figures_module = analytics_figures()
+    figures = {}
+    etags = [str(current_user.user_id)]
+
+    for each_graph, (depends_on, builder) in figures_module.DASHBOARD_FIGURES.items():
+        figures[each_graph], figure_etag = figure_cache.get(each_graph, depends_on, profiled(builder))
+        etags.append(figure_etag)
+
+    revenue_range = request.args.get('revenue_range', figures_module.DEFAULT_REVENUE_RANGE)
+    if revenue_range not in figures_module.REVENUE_RANGES:
+        revenue_range = figures_module.DEFAULT_REVENUE_RANGE
+    start_date = revenue_start_date(figures_module, revenue_range)
+
+    # One entry per range, rebuilt when the range's start day moves on
+    for each_graph, (depends_on, builder) in figures_module.REVENUE_FIGURES.items():
+        figures[each_graph], figure_etag = figure_cache.get(f'{each_graph}:{revenue_range}', depends_on,
+                                                            profiled(builder, start_date), variant=start_date)
+        etags.append(figure_etag)
+
+    # Let the browser revalidate, and skip rendering when none of the figures have changed
+    etag = combine_etags(*etags)
+    # Weak comparison: compressed responses carry the ETag as a weak validator (see compression.py)
+    if request.if_none_match.contains_weak(etag) and not session.get('_flashes'):
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template('analytics_dashboard.html', revenue_range=revenue_range,
+                                                      revenue_ranges=figures_module.REVENUE_RANGES, **figures))
+
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.no_cache = True
+    return response
+
+
+@analytics_bp.route('/analytics-dashboard/events')
+@login_required
+@role_required(['ADMIN'])
+def dashboard_events():
+    # Server-sent order deltas for an open dashboard (see dashboard_events.py)
+    events = current_app.extensions['dashboard_events']
+    response = Response(stream_with_context(events.stream()), mimetype='text/event-stream')
+    response.cache_control.no_cache = True
+    # Keeps reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,67 @@
+import pandas as pd
+from flask import g, has_app_context
+from sqlalchemy import select, func, union_all
+from models import db, StoreOrder, ProductDailySales, OrderArchiveHourly
+from rollups import weekday_of, hour_of
+
+
+# Columnar data access for the analytics dashboard. Queries are read straight into DataFrames
+# with pd.read_sql and explicit dtypes, and the derived order metrics come from a single
+# grouped query that is reshaped with vectorized pandas operations.
+
+WEEKDAY_NAMES = ['Sun', 'Mon', 'Tue', 'Wed', 'Thu', 'Fri', 'Sat']
+
+
+def read_frame(query, dtypes=None):
+    # Accepts a Query or a select(); the rows never pass through Python tuples
+    statement = getattr(query, 'statement', query)
+    return pd.read_sql(statement, db.session.connection(), dtype=dtypes)
+
+
+def order_metrics_query():
+    # Every order falls in exactly one weekday/hour cell, so this is a single pass over store_order,
+    # plus the precomputed cells of archived orders (the pivot below adds the two together)
+    weekday = weekday_of(StoreOrder.order_date)
+    hour = hour_of(StoreOrder.order_date)
+
+    live = select(
+        weekday.label('weekday'),
+        hour.label('hour'),
+        func.count(StoreOrder.order_id).label('orders'),
+    ) \
+    .group_by(weekday, hour)
+
+    archived = select(OrderArchiveHourly.weekday, OrderArchiveHourly.hour, OrderArchiveHourly.order_count)
+
+    return union_all(live, archived)
+
+
+def compute_order_metrics():
+    by_time = read_frame(order_metrics_query(), dtypes={'weekday': 'int64', 'hour': 'int64', 'orders': 'int64'})
+
+    total_orders = int(by_time['orders'].sum())
+    # Revenue comes from the product_daily_sales aggregate rather than a scan of order_item
+    total_revenue = float(db.session.query(func.coalesce(func.sum(ProductDailySales.revenue), 0)).scalar())
+
+    orders_by_weekday_hour = by_time.pivot_table(index='weekday', columns='hour', values='orders',
+                                                 aggfunc='sum', fill_value=0) \
+        .reindex(index=range(7), columns=range(24), fill_value=0) \
+        .set_axis(WEEKDAY_NAMES, axis='index')
+
+    return {
+        'total_orders': total_orders,
+        'total_revenue': total_revenue,
+        'average_order_value': total_revenue / total_orders if total_orders else 0.0,
+        'orders_by_weekday': orders_by_weekday_hour.sum(axis='columns'),
+        'orders_by_hour': orders_by_weekday_hour.sum(axis='index'),
+        'orders_by_weekday_hour': orders_by_weekday_hour,
+    }
+
+
+def order_metrics():
+    # Several dashboard figures use these metrics; compute them once per request
+    if not has_app_context():
+        return compute_order_metrics()
+    if 'order_metrics' not in g:
+        g.order_metrics = compute_order_metrics()
+    return g.order_metrics
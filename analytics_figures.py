@@ -0,0 +1,162 @@
+import plotly.express as px
+from sqlalchemy import func
+from models import db, Product, ProductCategory
+from analytics_data import read_frame, order_metrics
+import rollups
+
+
+# Figure builders for the analytics dashboard. This module is only imported on the first
+# dashboard request so storefront workers never load pandas or plotly.
+
+
+def build_product_counts_figure():
+    qry_product_counts = db.session.query(
+        ProductCategory.category_name.label('category_names'),
+        func.count(Product.category_id).label('category_counts')
+    ) \
+    .join(ProductCategory, Product.category_id == ProductCategory.category_id) \
+    .group_by(Product.category_id) \
+    .order_by(ProductCategory.category_name)
+
+    df_product_counts = read_frame(qry_product_counts, dtypes={'category_names': 'string', 'category_counts': 'int64'})
+
+    product_counts_figure = px.bar(data_frame=df_product_counts, x='category_names', y='category_counts',
+                                   title='Number of Products Offered by Category',
+                                   labels={'category_names':'', 'category_counts':'Count'},
+                                   color_discrete_sequence=['#990000'],
+                                   text_auto = True
+                            )
+
+    product_counts_figure.update_layout(
+        yaxis = {'tickmode':'linear', 'dtick':1},
+        title = {'x':0.5}
+    )
+
+    return product_counts_figure.to_json()
+
+
+def build_orders_past_30_figure():
+    qry_orders_past_30 = rollups.orders_since(days=30)
+
+    df_orders_past_30 = read_frame(qry_orders_past_30, dtypes={'order_count': 'int64'})
+
+    orders_past_30_figure = px.pie(df_orders_past_30, names='order_count', values='order_count', title='Number of Orders in Past 30 Days',
+            color_discrete_sequence=['#990000'])
+    orders_past_30_figure.update_traces(textposition='inside', textinfo='label', hovertemplate=None, hoverinfo='none', textfont_size=24, showlegend=False)
+    orders_past_30_figure.update_layout(
+        title={'x': 0.5}
+    )
+    return orders_past_30_figure.to_json()
+
+
+def build_orders_by_state_figure():
+    qry_orders_by_state = rollups.orders_by_state()
+
+    # Already ordered by state in SQL
+    df_orders_by_state = read_frame(qry_orders_by_state, dtypes={'states': 'string', 'order_counts': 'int64'})
+
+    labels = df_orders_by_state['states'].unique()
+
+    orders_by_state_figure = px.pie(df_orders_by_state, names='states', labels=labels, values='order_counts', title='All Orders Segmented by State',
+            color_discrete_sequence=px.colors.qualitative.Antique)
+
+    # Make sure that Plotly won't reorder the states while plotting
+    orders_by_state_figure.update_traces(textposition='inside', textinfo='label+percent', textfont_size=16, sort=False)
+    orders_by_state_figure.update_layout(
+        title={'x': 0.5}
+    )
+    return orders_by_state_figure.to_json()
+
+
+def build_orders_by_month_figure():
+    # Orders by Month (rolled up from the daily per-state counts)
+    qry_orders_by_month = rollups.orders_by_month()
+
+    df_orders_by_month = read_frame(qry_orders_by_month, dtypes={'order_month': 'string', 'order_counts': 'int64'})
+
+    orders_by_month_figure = px.line(df_orders_by_month, x='order_month', y='order_counts', title='All Orders Segmented by Month', markers=True,
+            color_discrete_sequence=px.colors.qualitative.Antique,
+            labels={'order_month': '', 'order_counts': 'Count'})
+    orders_by_month_figure.update_layout(
+        title={'x': 0.5}
+    )
+    return orders_by_month_figure.to_json()
+
+
+def build_orders_by_weekday_hour_figure():
+    metrics = order_metrics()
+
+    orders_by_weekday_hour_figure = px.imshow(metrics['orders_by_weekday_hour'],
+            title=f"Orders by Day and Hour (Average Order Value {metrics['average_order_value']:,.2f})",
+            labels={'x': 'Hour of Day', 'y': '', 'color': 'Orders'},
+            color_continuous_scale=['#ffffff', '#990000'], aspect='auto')
+    orders_by_weekday_hour_figure.update_layout(
+        xaxis={'tickmode': 'linear', 'dtick': 1},
+        title={'x': 0.5}
+    )
+    return orders_by_weekday_hour_figure.to_json()
+
+
+def build_revenue_by_month_figure(start_date):
+    df_revenue_by_month = read_frame(rollups.revenue_by_month(start_date), dtypes={'sales_month': 'string', 'revenue': 'float64'})
+
+    revenue_by_month_figure = px.line(df_revenue_by_month, x='sales_month', y='revenue', title='Revenue by Month', markers=True,
+            color_discrete_sequence=['#990000'],
+            labels={'sales_month': '', 'revenue': 'Revenue ($)'})
+    revenue_by_month_figure.update_layout(
+        title={'x': 0.5}
+    )
+    return revenue_by_month_figure.to_json()
+
+
+def build_top_products_figure(start_date):
+    df_top_products = read_frame(rollups.top_products(TOP_PRODUCTS_LIMIT, start_date),
+                                 dtypes={'product_name': 'string', 'revenue': 'float64', 'quantity': 'int64'})
+
+    top_products_figure = px.bar(df_top_products, x='revenue', y='product_name', orientation='h',
+            title=f'Top {TOP_PRODUCTS_LIMIT} Products by Revenue',
+            labels={'product_name': '', 'revenue': 'Revenue ($)'},
+            hover_data=['quantity'],
+            color_discrete_sequence=['#990000'],
+            text_auto='.2s')
+    # Largest at the top
+    top_products_figure.update_layout(
+        yaxis={'autorange': 'reversed'},
+        title={'x': 0.5}
+    )
+    return top_products_figure.to_json()
+
+
+def build_revenue_by_category_figure(start_date):
+    df_revenue_by_category = read_frame(rollups.revenue_by_category(start_date), dtypes={'category_name': 'string', 'revenue': 'float64'})
+
+    revenue_by_category_figure = px.bar(df_revenue_by_category, x='category_name', y='revenue',
+            title='Revenue by Product Category',
+            labels={'category_name': '', 'revenue': 'Revenue ($)'},
+            color_discrete_sequence=['#990000'],
+            text_auto='.2s')
+    revenue_by_category_figure.update_layout(
+        title={'x': 0.5}
+    )
+    return revenue_by_category_figure.to_json()
+
+
+# Template variable -> (data the figure depends on, figure builder)
+DASHBOARD_FIGURES = {
+    'product_counts_graph': (['products'], build_product_counts_figure),
+    'orders_past_30_graph': (['orders'], build_orders_past_30_figure),
+    'orders_by_state_graph': (['orders'], build_orders_by_state_figure),
+    'orders_by_date_graph': (['orders'], build_orders_by_month_figure),
+    'orders_by_weekday_hour_graph': (['orders'], build_orders_by_weekday_hour_figure),
+}
+
+# Revenue figures are built for the selected date range (days back, None for all time)
+REVENUE_RANGES = {'30': 30, '90': 90, '365': 365, 'all': None}
+DEFAULT_REVENUE_RANGE = '365'
+TOP_PRODUCTS_LIMIT = 10
+
+REVENUE_FIGURES = {
+    'revenue_by_month_graph': (['orders'], build_revenue_by_month_figure),
+    'top_products_graph': (['orders', 'products'], build_top_products_figure),
+    'revenue_by_category_graph': (['orders', 'products'], build_revenue_by_category_figure),
+}
@@ -1,38 +1,169 @@
 import os
-from flask import Flask, render_template, request, redirect, url_for, flash, session
+from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, Response, stream_with_context
 from flask_login import LoginManager, login_user, login_required, logout_user, current_user
-from sqlalchemy import func
 from werkzeug.security import check_password_hash
 from werkzeug.utils import secure_filename
+from jinja2 import FileSystemBytecodeCache
+from sqlalchemy.exc import OperationalError
 from authorize import role_required
 from models import *
-import plotly.express as px
-import pandas as pd
-import plotly.graph_objects as go
-import datetime as dt
+from database import init_database
+import rollups
+import orders
+import catalog
+import search
+import migrations
+import query_plans
+import exports
+import archive
+import catalog_import
+import click
+import uuid
+from cart_store import create_cart_store, DatabaseCartStore, cart_expiry_cutoff
+from catalog_snapshot import CatalogSnapshots, bump_catalog_version
+from order_writer import OrderWriter
+from page_cache import create_page_cache, cache_anonymous_page, cached_fragment, cache_key, writable_directory
+from figure_cache import FigureCache
+from dashboard_events import DashboardEvents
+from profiling import RequestProfiler
+from compression import ResponseCompressor
+from user_cache import UserCache
+from image_pipeline import ImagePipeline, is_content_hashed
 
 
 basedir = os.path.abspath(os.path.dirname(__file__))
 
 app = Flask(__name__)
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + os.path.join(basedir, 'store.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['SECRET_KEY'] = 'beyond_course_scope'
-db.init_app(app)
+
+# Compiled templates are kept on disk so new workers load them instead of recompiling. Without a
+# writable directory (e.g. a read-only deployment) each worker compiles them itself.
+app.config['JINJA_BYTECODE_CACHE_DIR'] = os.environ.get('JINJA_BYTECODE_CACHE_DIR', os.path.join(basedir, 'cache', 'jinja'))
+if writable_directory(app.config['JINJA_BYTECODE_CACHE_DIR']):
+    app.jinja_env.bytecode_cache = FileSystemBytecodeCache(app.config['JINJA_BYTECODE_CACHE_DIR'])
+
+# DATABASE_URL overrides the local SQLite file; see database.py for the engine settings
+init_database(app, db, default_uri='sqlite:///' + os.path.join(basedir, 'store.db'))
 
 # Product image parameters
 app.config['PRODUCT_UPLOAD_PATH'] = 'static/products'
+app.config['PRODUCT_IMAGE_VARIANTS'] = {'grid': 400, 'detail': 1000}  # longest side in pixels
+app.config['PRODUCT_IMAGE_WORKERS'] = 2
+app.config['PRODUCT_IMAGE_MAX_AGE'] = 365 * 24 * 60 * 60
+
+# Catalog paging (home and product_view_all)
+app.config['CATALOG_PAGE_SIZE'] = 24
+app.config['CATALOG_MAX_PAGE_SIZE'] = 100
+
+# Storefront reads (catalog pages, product details, cart prices) come from an in-memory catalog
+# snapshot; each worker checks the shared catalog version at most this often (seconds)
+app.config['CATALOG_SNAPSHOT_CHECK_INTERVAL'] = 1.0
+catalog_snapshots = CatalogSnapshots(check_interval=app.config['CATALOG_SNAPSHOT_CHECK_INTERVAL'])
+app.extensions['catalog_snapshots'] = catalog_snapshots
+
+# Storefront page cache: 'memory' (per worker LRU), 'filesystem' (shared by workers on a host) or 'none'.
+# Entries are tied to the shared catalog version, so a catalog change made anywhere drops them.
+app.config['PAGE_CACHE'] = os.environ.get('PAGE_CACHE', 'memory')
+app.config['PAGE_CACHE_MAX_ENTRIES'] = 512
+app.config['PAGE_CACHE_DIR'] = os.environ.get('PAGE_CACHE_DIR', os.path.join(basedir, 'cache', 'pages'))
+page_cache = create_page_cache(app.config['PAGE_CACHE'], lambda: catalog_snapshots.current().version,
+                               max_entries=app.config['PAGE_CACHE_MAX_ENTRIES'], directory=app.config['PAGE_CACHE_DIR'])
+app.extensions['page_cache'] = page_cache
+
+
+def product_images_ready(filename):
+    # Pages rendered before the variants existed link to the original upload; bumping the
+    # shared catalog version drops them from every worker's page cache
+    with app.app_context(), db.engine.begin() as connection:
+        bump_catalog_version(connection)
+    catalog_snapshots.invalidate()
+
+
+# Resized product images are made in the background
+image_pipeline = ImagePipeline(os.path.join(basedir, app.config['PRODUCT_UPLOAD_PATH']),
+                               app.config['PRODUCT_IMAGE_VARIANTS'], max_workers=app.config['PRODUCT_IMAGE_WORKERS'],
+                               on_complete=product_images_ready)
+app.extensions['image_pipeline'] = image_pipeline
 
 # Product order restrictions
 app.config['MAX_QUANTITY_PER_ITEM'] = 99
 
+# Where carts are kept: 'database' (shared by all workers) or 'memory' (single process only)
+app.config['CART_STORE'] = os.environ.get('CART_STORE', 'database')
+cart_store = create_cart_store(app.config['CART_STORE'])
+app.extensions['cart_store'] = cart_store
+# Database carts not changed for this many days are deleted by 'flask purge-carts'
+app.config['CART_EXPIRE_DAYS'] = int(os.environ.get('CART_EXPIRE_DAYS', 30))
+
+# Write-behind checkout: orders are committed in batches by one writer thread per worker
+# instead of one transaction per request (see order_writer.py)
+app.config['ORDER_WRITE_BEHIND'] = os.environ.get('ORDER_WRITE_BEHIND', '0') == '1'
+app.config['ORDER_WRITER_MAX_BATCH'] = 100
+app.config['ORDER_WRITER_TIMEOUT'] = 30
+order_writer = OrderWriter(app, max_batch=app.config['ORDER_WRITER_MAX_BATCH'],
+                           timeout=app.config['ORDER_WRITER_TIMEOUT']) if app.config['ORDER_WRITE_BEHIND'] else None
+
+# Orders older than this many days are moved to the yearly archive tables by 'flask archive-orders'
+app.config['ARCHIVE_AFTER_DAYS'] = int(os.environ.get('ARCHIVE_AFTER_DAYS', 2 * 365))
+app.config['ARCHIVE_BATCH_SIZE'] = 1000
+
+# Products written per transaction by the bulk product import
+app.config['IMPORT_BATCH_SIZE'] = 1000
+
+# Rows fetched per server-side cursor batch (and per Parquet row group) when exporting orders
+app.config['EXPORT_BATCH_SIZE'] = 10000
+
+# Per request query count/DB/render timings (Server-Timing header and /metrics)
+app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '1') == '1'
+request_profiler = RequestProfiler(app) if app.config['PROFILING_ENABLED'] else None
+
+# gzip/brotli compression of text responses of at least COMPRESS_MIN_SIZE bytes; turn it off
+# when a reverse proxy compresses instead. Registered after the profiler so its time is counted.
+app.config['COMPRESSION_ENABLED'] = os.environ.get('COMPRESSION_ENABLED', '1') == '1'
+app.config['COMPRESS_MIN_SIZE'] = 1024
+app.config['COMPRESS_CACHE_MAX_ENTRIES'] = 256
+response_compressor = ResponseCompressor(app, min_size=app.config['COMPRESS_MIN_SIZE'],
+                                         max_entries=app.config['COMPRESS_CACHE_MAX_ENTRIES']) \
+    if app.config['COMPRESSION_ENABLED'] else None
+
+# Seconds an analytics figure is served from cache before being rebuilt; figures built from
+# products are also rebuilt once the shared catalog version changes
+app.config['FIGURE_CACHE_TTL'] = 300
+figure_cache = FigureCache(ttl=app.config['FIGURE_CACHE_TTL'],
+                           shared_versions=lambda: {'products': catalog_snapshots.current().version})
+app.extensions['figure_cache'] = figure_cache
+
+# Open dashboards get new order counts pushed over server-sent events. Each open stream holds a
+# worker thread, so this needs a threaded server; orders placed by other worker processes show
+# up within the poll interval.
+app.config['DASHBOARD_EVENTS_POLL_SECONDS'] = 5
+app.config['DASHBOARD_EVENTS_HEARTBEAT_SECONDS'] = 15
+app.config['DASHBOARD_EVENTS_MAX_SECONDS'] = 600
+dashboard_events = DashboardEvents(poll_interval=app.config['DASHBOARD_EVENTS_POLL_SECONDS'],
+                                   heartbeat_interval=app.config['DASHBOARD_EVENTS_HEARTBEAT_SECONDS'],
+                                   max_duration=app.config['DASHBOARD_EVENTS_MAX_SECONDS'])
+app.extensions['dashboard_events'] = dashboard_events
+
+# The analytics dashboard (and its pandas/plotly dependencies) can be turned off for storefront-only workers
+app.config['ANALYTICS_ENABLED'] = os.environ.get('ANALYTICS_ENABLED', '1') == '1'
+
+if app.config['ANALYTICS_ENABLED']:
+    from analytics import analytics_bp
+    app.register_blueprint(analytics_bp)
+
+# Logged in users are loaded from a short lived cache instead of the user table on every request
+app.config['USER_CACHE_TTL'] = 60
+app.config['USER_CACHE_MAX_ENTRIES'] = 10000
+user_cache = UserCache(ttl=app.config['USER_CACHE_TTL'], max_entries=app.config['USER_CACHE_MAX_ENTRIES'])
+
 login_manager = LoginManager()
 login_manager.login_view = 'login' # default login route
 login_manager.init_app(app)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return User.query.get(int(user_id))
+    return user_cache.get(int(user_id), lambda user_id: db.session.get(User, user_id))
 
 
 ### Routes for All Users ###
@@ -76,37 +207,117 @@ def login():
 @app.route('/logout')
 @login_required
 def logout():
-    if 'cart' in session:
-        del (session['cart'])
+    if 'cart_id' in session:
+        cart_store.clear(session.pop('cart_id'))
 
     logout_user()
     flash(f'You have been logged out.', 'success')
     return redirect(url_for('home'))
 
+@app.template_global()
+def product_image_url(filename):
+    return url_for('product_image_file', filename=filename)
+
+
+@app.template_global()
+def product_image(filename, variant):
+    # URLs for a product image variant and its WebP version, falling back to the original upload
+    variant_name = image_pipeline.variant(filename, variant) if filename else None
+    webp_name = image_pipeline.variant(filename, variant, '.webp') if filename else None
+    return {'src': product_image_url(variant_name or filename),
+            'webp': product_image_url(webp_name) if webp_name else None}
+
+
+@app.route('/images/products/<path:filename>')
+def product_image_file(filename):
+    # Content hashed names never change content, so they can be cached indefinitely. Images
+    # uploaded before hashing keep their name when replaced and must be revalidated.
+    # send_from_directory answers conditional (If-None-Match/If-Modified-Since) and Range requests.
+    if is_content_hashed(filename):
+        response = send_from_directory(image_pipeline.directory, filename, max_age=app.config['PRODUCT_IMAGE_MAX_AGE'])
+        response.cache_control.public = True
+        response.cache_control.immutable = True
+    else:
+        response = send_from_directory(image_pipeline.directory, filename, max_age=0)
+        response.cache_control.no_cache = True
+    return response
+
+
 ### Customer Routes ###
+def catalog_page():
+    # One keyset page of the catalog plus what the pager needs to link to its neighbours
+    page_args = catalog.page_arguments(request.args, app.config['CATALOG_PAGE_SIZE'], app.config['CATALOG_MAX_PAGE_SIZE'])
+    snapshot = catalog_snapshots.current()
+    page = snapshot.product_page(**page_args)
+
+    # Query string arguments carried over to the previous/next page links
+    page_params = {'category': page_args['category_id']}
+    if page_args['page_size'] != app.config['CATALOG_PAGE_SIZE']:
+        page_params['page_size'] = page_args['page_size']
+
+    return dict(page, product_categories=snapshot.categories,
+                category_id=page_args['category_id'], page_params=page_params)
+
+
+def current_cart_id():
+    # The session cookie only carries an opaque cart id; the cart itself is kept server-side
+    if 'cart_id' not in session:
+        session['cart_id'] = uuid.uuid4().hex
+    return session['cart_id']
+
+
+CATALOG_QUERY_ARGS = ['category', 'after', 'before', 'page_size']
+
+
 @app.route('/')
+@cache_anonymous_page(page_cache, query_args=CATALOG_QUERY_ARGS)
 def home():
-    products = Product.query.order_by(Product.product_name).all()
-    return render_template('home.html', products=products)
+    catalog_fragment = cached_fragment(page_cache, cache_key('home', CATALOG_QUERY_ARGS),
+                                       lambda: render_template('_home_catalog.html', **catalog_page()))
+    return render_template('home.html', catalog_fragment=catalog_fragment)
+
+
+def render_product_detail(product_id):
+    product = catalog_snapshots.current().product(product_id)
+
+    if product:
+        return {'product_name': product.product_name,
+                'product_fragment': render_template('_product_detail.html', product=product)}
 
 
 @app.route('/product/<int:product_id>')
+@cache_anonymous_page(page_cache)
 def product_view(product_id):
-    product = Product.query.filter_by(product_id=product_id).first()
+    product_detail = cached_fragment(page_cache, f'product:{product_id}', lambda: render_product_detail(product_id))
 
-    if product:
-        return render_template('product_view.html', product=product)
+    if product_detail:
+        return render_template('product_view.html', **product_detail)
 
     else:
         flash(f'Product attempting to be viewed could not be found! Please contact support for assistance', 'error')
         return redirect(url_for('home'))
 
 
+@app.route('/search')
+@cache_anonymous_page(page_cache, query_args=['q', 'page'])
+def product_search():
+    query = request.args.get('q', '').strip()
+    page = max(1, request.args.get('page', 1, type=int))
+
+    try:
+        products, has_next = search.search_products(query, page=page, page_size=app.config['CATALOG_PAGE_SIZE'])
+    except OperationalError:
+        # The search index has not been created for this database yet (see 'flask rebuild-search-index')
+        flash(f'Search is currently unavailable. Please contact support if this problem persists.', 'error')
+        products, has_next = [], False
+
+    return render_template('search.html', query=query, products=products, page=page, has_next=has_next)
+
+
 @app.route('/cart/clear')
 @login_required
 def clear_cart():
-    if 'cart' in session:
-        del(session['cart'])
+    if 'cart_id' in session and cart_store.clear(session['cart_id']):
         flash(f"Cart Cleared", 'success')
     else:
         flash(f"Cart alredy empty", 'error')
@@ -115,52 +326,34 @@ def clear_cart():
 @app.route('/cart/add/<int:product_id>', methods=['GET','POST'])
 @login_required
 def cart_add(product_id):
-    product = Product.query.filter_by(product_id=product_id).first()
+    product = catalog_snapshots.current().product(product_id)
     if 'product_quantity' in request.form:
         product_quantity = int(request.form['product_quantity'])
-    elif request.method == 'GET':
+    else:
         product_quantity = 1
 
     if product:
-        if 'cart' not in session:
-            session['cart'] = []
-
-        found_item = next((item for item in session['cart'] if item['product_id'] == product_id), None)
-        if found_item:
-            found_item['product_quantity'] += product_quantity
-
-            if found_item['product_quantity'] > app.config['MAX_QUANTITY_PER_ITEM']:
-                found_item['product_quantity'] = app.config['MAX_QUANTITY_PER_ITEM']
-                flash(f"You cannot exceed more than {app.config['MAX_QUANTITY_PER_ITEM']} of the same item.")
-
-        else:
-            session['cart'].append(
-                {'product_id': product.product_id, 'product_name':product.product_name,
-                 'product_image':product.product_image, 'product_quantity': product_quantity,
-                 'product_price':product.product_price}
-            )
-
-        session['cart_total'] = sum(item['product_price']*item['product_quantity'] for item in session['cart'])
+        product_quantity, capped = cart_store.add_item(current_cart_id(), product, product_quantity,
+                                                       app.config['MAX_QUANTITY_PER_ITEM'])
+        if capped:
+            flash(f"You cannot exceed more than {app.config['MAX_QUANTITY_PER_ITEM']} of the same item.")
 
         flash(f"{product.product_name} has been successfully added to your cart.", 'success')
         return redirect(url_for('cart_view'))
     else:
         flash(f'Product could not be found. Please contact support if this problem persists.', 'error')
+        return redirect(url_for('home'))
 
 
-@app.route('/cart/remove/<int:index>', methods=['GET'])
+@app.route('/cart/remove/<int:product_id>', methods=['GET'])
 @login_required
-def cart_remove(index):
-    if 'cart' in session:
-        if index < len(session['cart']):
-            product_name = session['cart'][index]['product_name']
-            session['cart'].pop(index)
-            flash(f"{product_name} has been successfully removed from your cart.", 'success')
-
-        else:
-            flash(f'Product is not in the cart and could not be removed.', 'error')
+def cart_remove(product_id):
+    removed_item = cart_store.remove_item(current_cart_id(), product_id)
 
-    session['cart_total'] = sum(item['product_price'] * item['product_quantity'] for item in session['cart'])
+    if removed_item:
+        flash(f"{removed_item['product_name']} has been successfully removed from your cart.", 'success')
+    else:
+        flash(f'Product is not in the cart and could not be removed.', 'error')
 
     return redirect(url_for('cart_view'))
 
@@ -168,16 +361,17 @@ def cart_remove(index):
 @app.route('/cart/view', methods=['GET', 'POST'])
 @login_required
 def cart_view():
-    if 'cart' in session:
-        return render_template('cart_view.html', products=session['cart'], cart_count=len(session['cart']), cart_total=session['cart_total'])
-    else:
-        return render_template('cart_view.html', cart_count=0)
+    cart_id = current_cart_id()
+    products = cart_store.items(cart_id)
+    return render_template('cart_view.html', products=products, cart_count=len(products), cart_total=cart_store.total(cart_id))
 
 
 @app.route('/checkout')
 @login_required
 def checkout():
-    return render_template('checkout.html', products=session['cart'], cart_count=len(session['cart']), cart_total=session['cart_total'])
+    cart_id = current_cart_id()
+    products = cart_store.items(cart_id)
+    return render_template('checkout.html', products=products, cart_count=len(products), cart_total=cart_store.total(cart_id))
 
 
 @app.route('/process-order', methods=['GET', 'POST'])
@@ -189,41 +383,54 @@ def process_order():
         customer = Customer.query.filter_by(user_id=current_user.user_id).first()
 
         customer_id = customer.customer_id
-        first_name = request.form['first_name']
-        last_name = request.form['last_name']
-        phone_number = request.form['phone']
-        email = request.form['email']
-        address = request.form['address']
-        city = request.form['city']
-        state = request.form['state']
-        zip = request.form['zip']
-
-        store_order = StoreOrder(customer_id=customer_id, first_name=first_name, last_name=last_name,phone_number=phone_number,
-                                 email=email, address=address, city=city, state=state, zip=zip)
-        db.session.add(store_order)
-        db.session.flush()
-        db.session.refresh(store_order)
-        order_id = store_order.order_id
-
-        for each_item in session['cart']:
-            item_ordered = OrderItem(order_id, each_item['product_id'], each_item['product_quantity'])
-            db.session.add(item_ordered)
-
-        db.session.commit()
+        shipping = {
+            'first_name': request.form['first_name'],
+            'last_name': request.form['last_name'],
+            'phone_number': request.form['phone'],
+            'email': request.form['email'],
+            'address': request.form['address'],
+            'city': request.form['city'],
+            'state': request.form['state'],
+            'zip': request.form['zip'],
+        }
 
-    if 'cart' in session:
-        del(session['cart'])
+        try:
+            place_order = order_writer.place_order if order_writer else orders.place_order
+            order_id = place_order(customer_id, shipping, cart_store.items(current_cart_id()),
+                                   snapshot=catalog_snapshots.current(check=True))
+        except orders.OrderPending as e:
+            # The cart is cleared so the same order cannot be submitted twice
+            if 'cart_id' in session:
+                cart_store.clear(session.pop('cart_id'))
+            flash(str(e), 'error')
+            return redirect(url_for('home'))
+        except orders.OrderError as e:
+            flash(f'Your order could not be placed. {e}', 'error')
+            return redirect(url_for('cart_view'))
+
+        figure_cache.invalidate('orders')
+        dashboard_events.publish()
+
+    if 'cart_id' in session:
+        cart_store.clear(session.pop('cart_id'))
 
     return render_template('thank_you.html', order_number=order_id)
 
 
 ### Admin Routes ###
+def save_product_image(product_code, product_image):
+    # Stored as <product code>-<content hash>.<ext>; the product code prefix avoids two products sharing a file
+    extension = os.path.splitext(secure_filename(product_image.filename))[1]
+    product_filename = image_pipeline.save_upload(product_image, secure_filename(product_code), extension)
+    image_pipeline.submit(product_filename)
+    return product_filename
+
+
 @app.route('/product/view_all')
 @login_required
 @role_required(['ADMIN'])
 def product_view_all():
-    products = Product.query.order_by(Product.product_name).all()
-    return render_template('product_view_all.html', products=products)
+    return render_template('product_view_all.html', **catalog_page())
 
 
 @app.route('/product/create', methods=['GET', 'POST'])
@@ -242,16 +449,17 @@ def product_create():
         product_description = request.form['product_description']
         product_price = request.form['product_price']
         product_image = request.files['product_image']
-        product_filename = secure_filename(product_code + '-' + product_image.filename) #prepend unique product code to avoid filename collisions
+        product_filename = ''
 
         if product_image.filename != '':
-            product_image.save(os.path.join(basedir, app.config['PRODUCT_UPLOAD_PATH'], product_filename))
+            product_filename = save_product_image(product_code, product_image)
 
         product = Product(product_name=product_name, category_id=product_category_id,
                           product_code=product_code, product_description=product_description,
-                          product_price=product_price, product_image=product_filename if product_image else '')
+                          product_price=product_price, product_image=product_filename)
         db.session.add(product)
         db.session.commit()
+        figure_cache.invalidate('products')
         flash(f'{product_name} was successfully added!', 'success')
         return redirect(url_for('product_view_all'))
 
@@ -288,21 +496,15 @@ def product_edit(product_id):
             product_image = request.files['product_image']
 
             # When a new image is provided, or there is a desire to delete the current image, attempt to delete it
-            if ('delete_product_image' in request.form or product_image != '') and 'current_product_image' != '' :
-                try:
-                    os.remove(os.path.join(basedir, app.config['PRODUCT_UPLOAD_PATH'], product.product_image))
-                    product.product_image = ''
-                except:
-                    pass # Nothing to do as file is no longer being stored
-
-
-                product_filename = secure_filename(product.product_code + '-' + product_image.filename)  # prepend unique product code to avoid filename collisions
+            if ('delete_product_image' in request.form or product_image.filename != '') and product.product_image:
+                image_pipeline.remove(product.product_image)
+                product.product_image = ''
 
-                if product_image.filename != '':
-                    product_image.save(os.path.join(basedir, app.config['PRODUCT_UPLOAD_PATH'], product_filename))
-                    product.product_image = product_filename if product_image else ''
+            if product_image.filename != '':
+                product.product_image = save_product_image(product.product_code, product_image)
 
             db.session.commit()
+            figure_cache.invalidate('products')
             flash(f'{product.product_name} was successfully updated!', 'success')
         else:
             flash(f'Product attempting to be edited could not be found!', 'error')
@@ -320,12 +522,10 @@ def product_edit(product_id):
 def product_delete(product_id):
     product = Product.query.filter_by(product_id=product_id).first()
     if product:
-        try:
-            os.remove(os.path.join(app.config['PRODUCT_UPLOAD_PATH'], product.product_image))
-        except:
-            pass  # Nothing to do as file is no longer being stored
+        image_pipeline.remove(product.product_image)
         db.session.delete(product)
         db.session.commit()
+        figure_cache.invalidate('products')
         flash(f'{product} was successfully deleted!', 'success')
     else:
         flash(f'Delete failed! Product could not be found.', 'error')
@@ -333,117 +533,158 @@ def product_delete(product_id):
     return redirect(url_for('product_view_all'))
 
 
-@app.route('/analytics-dashboard')
+@app.route('/product/import', methods=['GET', 'POST'])
+@login_required
+@role_required(['ADMIN'])
+def product_import():
+    if request.method == 'GET':
+        return render_template('product_import.html', import_formats=catalog_import.IMPORT_FORMATS)
+
+    import_file = request.files.get('import_file')
+    import_format = request.form.get('import_format') or catalog_import.import_format(import_file.filename if import_file else '')
+
+    if not import_file or import_file.filename == '':
+        flash(f'Choose a CSV or JSONL file of products to import.', 'error')
+        return redirect(url_for('product_import'))
+    if import_format not in catalog_import.IMPORT_FORMATS:
+        flash(f'Products cannot be imported from {import_file.filename}. Upload a CSV or JSONL file.', 'error')
+        return redirect(url_for('product_import'))
+
+    # The upload is read row by row from the request stream
+    rows = catalog_import.IMPORT_READERS[import_format](import_file.stream)
+    report = catalog_import.import_products(rows, batch_size=app.config['IMPORT_BATCH_SIZE'])
+
+    if report.inserted or report.updated:
+        catalog_snapshots.invalidate()
+        figure_cache.invalidate('products')
+
+    return render_template('product_import.html', import_formats=catalog_import.IMPORT_FORMATS,
+                           report=report, filename=import_file.filename)
+
+
+@app.route('/export/orders')
+@login_required
+@role_required(['ADMIN'])
+def export_orders():
+    export_format = request.args.get('format', 'csv')
+
+    try:
+        start_date = exports.parse_date(request.args.get('start'))
+        end_date = exports.parse_date(request.args.get('end'))
+    except ValueError:
+        flash(f'Export dates must be given as YYYY-MM-DD.', 'error')
+        return redirect(url_for('product_view_all'))
+
+    if export_format not in exports.EXPORT_FORMATS or (export_format == 'parquet' and not exports.parquet_available()):
+        flash(f'Orders cannot be exported as {export_format}.', 'error')
+        return redirect(url_for('product_view_all'))
+
+    mimetype = exports.EXPORT_FORMATS[export_format][0]
+    filename = exports.export_filename(export_format, start_date, end_date)
+    chunks = exports.export_chunks(export_format, start_date, end_date, batch_size=app.config['EXPORT_BATCH_SIZE'])
+    return Response(stream_with_context(chunks), mimetype=mimetype,
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
+
+@app.route('/metrics')
 @login_required
 @role_required(['ADMIN'])
-def analytics_dashboard():
-
-    # Product Count by Category Graph
-    qry_product_counts = db.session.query(
-        ProductCategory.category_name.label('category_names'),
-        func.count(Product.category_id).label('category_counts')
-    ) \
-    .join(ProductCategory, Product.category_id == ProductCategory.category_id) \
-    .group_by(Product.category_id) \
-    .order_by(ProductCategory.category_name) \
-    .all()
-
-    df_product_counts = pd.DataFrame(qry_product_counts, columns=['category_names', 'category_counts'])
-
-    product_counts_figure = px.bar(data_frame=df_product_counts, x='category_names', y='category_counts',
-                                   title='Number of Products Offered by Category',
-                                   labels={'category_names':'', 'category_counts':'Count'},
-                                   color_discrete_sequence=['#990000'],
-                                   text_auto = True
-                            )
-
-    product_counts_figure.update_layout(
-        yaxis = {'tickmode':'linear', 'dtick':1},
-        title = {'x':0.5}
-    )
-
-    product_counts_figure_JSON = product_counts_figure.to_json()
-
-
-    # Number of Orders in the Past 30 Days
-    qry_orders_past_30 = db.session.query(
-        func.count(StoreOrder.order_id).label("order_count")
-    ) \
-    .filter(StoreOrder.order_date >= dt.datetime.now() - dt.timedelta(days=30)) \
-    .all()
-
-    df_orders_past_30 = pd.DataFrame(qry_orders_past_30, columns=['order_count'])
-
-    orders_past_30_figure = px.pie(df_orders_past_30, names='order_count', values='order_count', title='Number of Orders in Past 30 Days',
-            color_discrete_sequence=['#990000'])
-    orders_past_30_figure.update_traces(textposition='inside', textinfo='label', hovertemplate=None, hoverinfo='none', textfont_size=24, showlegend=False)
-    orders_past_30_figure.update_layout(
-        title={'x': 0.5}
-    )
-    orders_past_30_figureJSON = orders_past_30_figure.to_json()
-
-
-    # Order Distribution by State
-    qry_orders_by_state = db.session.query(
-        StoreOrder.state.label('states'),
-        func.count(StoreOrder.order_id).label('order_counts')
-    ) \
-    .group_by(StoreOrder.state) \
-    .order_by(StoreOrder.state) \
-    .all()
-
-    df_orders_by_state = pd.DataFrame(qry_orders_by_state, columns=['states', 'order_counts'])
-    df_orders_by_state = df_orders_by_state.sort_values(by='states',
-  ascending=True)
-
-    labels = df_orders_by_state['states'].unique()
-    print(labels)
-
-    orders_by_state_figure = px.pie(df_orders_by_state, names='states', labels=labels, values='order_counts', title='All Orders Segmented by State',
-            color_discrete_sequence=px.colors.qualitative.Antique)
-
-    orders_by_state_figure.update_traces(textposition='inside', textinfo='label+percent', textfont_size=16, sort=False)
-    orders_by_state_figure.update_layout(
-        title={'x': 0.5}
-    )
-
-    fig = go.Figure(
-        data=[go.Pie(
-            labels=labels,
-            values=df_orders_by_state['order_counts'],
-            # Second, make sure that Plotly won't reorder your data while plotting
-            sort=False)
-        ])
-    fig.update_traces(textposition='inside', textinfo='label+percent', textfont_size=16)
-    fig.update_layout(
-        title={'x': 0.5})
-    orders_by_state_figureJSON = orders_by_state_figure.to_json()
-
-
-    # Orders by Month (Example of a Custom SQL Query for SQLite)
-    qry_orders_by_month = db.session.query(
-        func.strftime('%Y-%m', StoreOrder.order_date).label('order_month'),
-        func.count(StoreOrder.order_id).label("order_counts")
-    ) \
-    .group_by('order_month') \
-    .order_by('order_month') \
-    .all()
-
-    df_orders_by_month = pd.DataFrame(qry_orders_by_month, columns=['order_month', 'order_counts'])
-
-    orders_by_month_figure = px.line(df_orders_by_month, x='order_month', y='order_counts', title='All Orders Segmented by Month', markers=True,
-            color_discrete_sequence=px.colors.qualitative.Antique,
-            labels={'order_month': '', 'order_counts': 'Count'})
-    orders_by_month_figure.update_layout(
-        title={'x': 0.5}
-    )
-    orders_by_month_figureJSON = orders_by_month_figure.to_json()
-
-    return render_template('analytics_dashboard.html',
-            product_counts_graph=product_counts_figure_JSON,
-            orders_past_30_graph=orders_past_30_figureJSON,
-            orders_by_state_graph=orders_by_state_figureJSON,
-            orders_by_date_graph=orders_by_month_figureJSON)
+def metrics():
+    if request_profiler is None:
+        return 'Profiling is disabled.\n', 404, {'Content-Type': 'text/plain; charset=utf-8'}
+    return request_profiler.render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
+
+### CLI Commands ###
+@app.cli.command('rebuild-rollups')
+def rebuild_rollups_command():
+    # Recompute the order rollup tables from store_order (e.g. after loading orders outside of process_order)
+    rollups.rebuild_rollups()
+    print('Order rollups rebuilt.')
+
+
+@app.cli.command('rebuild-search-index')
+def rebuild_search_index_command():
+    # Create the product full-text search index (and its sync triggers) and fill it from product
+    search.create_search_index()
+    print('Product search index rebuilt.')
+
+
+@app.cli.command('export-orders')
+@click.option('--format', 'export_format', type=click.Choice(list(exports.EXPORT_FORMATS)), default='csv')
+@click.option('--start', help='first order date to include (YYYY-MM-DD)')
+@click.option('--end', help='last order date to include (YYYY-MM-DD)')
+@click.option('--output', type=click.Path(dir_okay=False), help='file to write (defaults to a name in the current directory)')
+def export_orders_command(export_format, start, end, output):
+    # Stream orders joined with their items and products to a CSV or Parquet file
+    start_date, end_date = exports.parse_date(start), exports.parse_date(end)
+    output = output or exports.export_filename(export_format, start_date, end_date)
+
+    with open(output, 'wb') as export_file:
+        for each_chunk in exports.export_chunks(export_format, start_date, end_date, batch_size=app.config['EXPORT_BATCH_SIZE']):
+            export_file.write(each_chunk.encode('utf-8') if isinstance(each_chunk, str) else each_chunk)
+    print(f'Orders exported to {output}.')
+
+
+@app.cli.command('import-products')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--format', 'import_format', type=click.Choice(catalog_import.IMPORT_FORMATS),
+              help='file format (defaults to the file extension)')
+@click.option('--batch-size', type=int, default=None, help='products written per transaction')
+def import_products_command(path, import_format, batch_size):
+    # Upsert products by product_code from a CSV or JSONL file, printing the rows that failed
+    import_format = import_format or catalog_import.import_format(path)
+    if import_format is None:
+        raise click.UsageError('Could not tell the file format from its name; pass --format.')
+
+    with open(path, 'rb') as import_file:
+        report = catalog_import.import_products(catalog_import.IMPORT_READERS[import_format](import_file),
+                                                batch_size=batch_size or app.config['IMPORT_BATCH_SIZE'])
+
+    for each_error in report.errors:
+        print(f'line {each_error["line"]}: {each_error["product_code"]}: {each_error["error"]}')
+    print(f'Products imported: {report}.')
+
+
+@app.cli.command('archive-orders')
+@click.option('--days', type=int, default=None, help='archive orders placed before this many days ago')
+@click.option('--batch-size', type=int, default=None, help='orders moved per transaction')
+def archive_orders_command(days, batch_size):
+    # Move old orders and their items out of store_order/order_item into per-year archive tables
+    before = archive.archive_cutoff(app.config['ARCHIVE_AFTER_DAYS'] if days is None else days)
+    archived = archive.archive_orders(before, batch_size=batch_size or app.config['ARCHIVE_BATCH_SIZE'])
+
+    for year, order_count in sorted(archived.items()):
+        print(f'{year}: {order_count} orders archived')
+    print(f'Orders placed before {before:%Y-%m-%d} archived ({sum(archived.values())} orders).')
+
+
+@app.cli.command('purge-carts')
+@click.option('--days', type=int, default=None, help='delete carts not changed for this many days')
+def purge_carts_command(days):
+    # Delete abandoned database carts; memory carts are bounded by their LRU instead
+    before = cart_expiry_cutoff(app.config['CART_EXPIRE_DAYS'] if days is None else days)
+    purged = DatabaseCartStore().purge_expired(before)
+    print(f'Carts not changed since {before:%Y-%m-%d %H:%M} purged ({purged} carts).')
+
+
+@app.cli.command('upgrade-db')
+def upgrade_db_command():
+    # Create tables and indexes declared in models.py that are missing from an existing database
+    created = migrations.upgrade_database()
+    print(f'Database upgraded ({created} indexes created).')
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans_command():
+    # Fail when a dashboard or checkout query would scan a table without using an index
+    if db.engine.dialect.name != 'sqlite':
+        print('Query plan checks are only available for SQLite.')
+        return
+
+    failures = query_plans.check_query_plans()
+    if failures:
+        raise SystemExit(f'{len(failures)} queries scan a table without an index.')
 
 
 if __name__ == '__main__':
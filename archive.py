@@ -0,0 +1,99 @@
+import datetime as dt
+import re
+from sqlalchemy import MetaData, Table, Column, Index, select, insert, delete, inspect
+from models import db, StoreOrder, OrderItem
+import rollups
+
+
+# Moves orders older than a cut-off date, with their items, out of store_order and order_item
+# into per-year archive tables (store_order_archive_2023, order_item_archive_2023, ...), so
+# the live tables only hold recent orders. Before each batch is moved it is added to the
+# archive summaries in rollups.py, which is how the dashboard's all-time charts (and a rollup
+# rebuild) keep counting archived orders without reading the archive tables.
+#
+# The archive tables are not part of db.metadata; create_all()/drop_all() leave them alone.
+
+ARCHIVE_TABLE_NAME = re.compile(r'^(store_order|order_item)_archive_\d{4}$')
+
+_archive_metadata = MetaData()
+
+
+def archive_table(live_table, year):
+    # Same columns as the live table, without its foreign keys
+    name = f'{live_table.name}_archive_{year}'
+    if name in _archive_metadata.tables:
+        return _archive_metadata.tables[name]
+
+    columns = [Column(each_column.name, each_column.type, primary_key=each_column.primary_key, autoincrement=False)
+               for each_column in live_table.columns]
+    table = Table(name, _archive_metadata, *columns)
+    # Items are looked up by the order they belong to
+    if not table.c.order_id.primary_key:
+        Index(f'ix_{name}_order_id', table.c.order_id)
+    return table
+
+
+def archive_table_names(connection=None):
+    return sorted(each_name for each_name in inspect(connection or db.engine).get_table_names()
+                  if ARCHIVE_TABLE_NAME.match(each_name))
+
+
+def drop_archive_tables():
+    with db.engine.begin() as connection:
+        for each_name in archive_table_names(connection):
+            connection.exec_driver_sql(f'DROP TABLE IF EXISTS {each_name}')
+
+
+def _copy_rows(session, live_table, year, order_ids):
+    table = archive_table(live_table, year)
+    table.create(session.connection(), checkfirst=True)
+    session.execute(insert(table).from_select(
+        [each_column.name for each_column in live_table.columns],
+        select(*live_table.columns).where(live_table.c.order_id.in_(order_ids))
+    ))
+
+
+def archive_orders(before, batch_size=1000, session=None, log=print):
+    # Archives every order placed before the given datetime, one transaction per batch, oldest first.
+    # Returns the number of orders archived per year.
+    session = session or db.session
+    archived = {}
+
+    while True:
+        batch = session.execute(
+            select(StoreOrder.order_id, StoreOrder.order_date)
+            .where(StoreOrder.order_date < before)
+            .order_by(StoreOrder.order_date)
+            .limit(batch_size)
+        ).all()
+        if not batch:
+            break
+
+        order_ids_by_year = {}
+        for order_id, order_date in batch:
+            order_ids_by_year.setdefault(order_date.year, []).append(order_id)
+        order_ids = [order_id for order_id, _ in batch]
+
+        try:
+            rollups.record_archived_orders(order_ids, session=session)
+            for year, year_order_ids in order_ids_by_year.items():
+                _copy_rows(session, StoreOrder.__table__, year, year_order_ids)
+                _copy_rows(session, OrderItem.__table__, year, year_order_ids)
+
+            session.execute(delete(OrderItem).where(OrderItem.order_id.in_(order_ids)))
+            session.execute(delete(StoreOrder).where(StoreOrder.order_id.in_(order_ids)))
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+
+        for year, year_order_ids in order_ids_by_year.items():
+            archived[year] = archived.get(year, 0) + len(year_order_ids)
+        log(f'{sum(archived.values())} orders archived')
+
+    return archived
+
+
+def archive_cutoff(days):
+    # Orders placed before midnight this many days ago are archived
+    return dt.datetime.combine(dt.date.today() - dt.timedelta(days=days), dt.time.min)
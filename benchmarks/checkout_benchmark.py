@@ -0,0 +1,89 @@
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from models import db, Customer, User, Product, ProductCategory, StoreOrder, OrderItem
+import orders
+import rollups
+
+# Checkout latency for carts of different sizes, comparing the previous per-line pricing
+# (one Product query and one INSERT per OrderItem) with orders.place_order.
+#
+#   python benchmarks/checkout_benchmark.py [runs]
+
+CART_SIZES = [1, 10, 100]
+
+SHIPPING = {'first_name': 'Bench', 'last_name': 'Mark', 'phone_number': '', 'email': '',
+            'address': '', 'city': '', 'state': 'MD', 'zip': ''}
+
+
+def create_bench_app(database_path):
+    bench_app = Flask(__name__)
+    bench_app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///' + database_path
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    db.init_app(bench_app)
+
+    with bench_app.app_context():
+        db.create_all()
+        db.session.add(User(username='bench', first_name='Bench', last_name='Mark', email='bench@example.com',
+                            password='', role='CUSTOMER'))
+        db.session.add(ProductCategory(category_id=1, category_name='Bench'))
+        db.session.flush()
+        db.session.add(Customer(1))
+        for i in range(max(CART_SIZES)):
+            db.session.add(Product(product_name=f'Product {i}', product_code=f'BENCH-{i}', product_description='',
+                                   product_image='', product_price=i + 0.99, category_id=1))
+        db.session.commit()
+
+    return bench_app
+
+
+def cart_of(size):
+    return [{'product_id': product_id, 'product_quantity': 2} for product_id in range(1, size + 1)]
+
+
+def place_order_per_line(customer_id, shipping, cart_items):
+    # The checkout path before batching, kept here for comparison
+    store_order = StoreOrder(customer_id=customer_id, **shipping)
+    db.session.add(store_order)
+    db.session.flush()
+    db.session.refresh(store_order)
+
+    for each_item in cart_items:
+        db.session.add(OrderItem(store_order.order_id, each_item['product_id'], each_item['product_quantity']))
+
+    rollups.record_order(store_order)
+    db.session.commit()
+    return store_order.order_id
+
+
+def time_checkout(place, cart_items, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        place(1, SHIPPING, cart_items)
+        timings.append((time.perf_counter() - start) * 1000)
+        db.session.remove()
+    return statistics.median(timings)
+
+
+def main(runs=50):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench_app = create_bench_app(os.path.join(tmp_dir, 'bench.db'))
+
+        print(f'{"cart lines":>10}{"per line (ms)":>16}{"batched (ms)":>16}')
+        with bench_app.app_context():
+            for each_size in CART_SIZES:
+                cart_items = cart_of(each_size)
+                per_line = time_checkout(place_order_per_line, cart_items, runs)
+                batched = time_checkout(orders.place_order, cart_items, runs)
+                print(f'{each_size:>10}{per_line:>16.2f}{batched:>16.2f}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
@@ -0,0 +1,129 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from flask import Flask
+from sqlalchemy.exc import OperationalError
+from models import db, Customer, User, Product, ProductCategory
+from database import init_database
+from catalog_snapshot import read_catalog_version
+import orders
+from order_writer import OrderWriter
+import rollups
+
+# Concurrent checkouts (orders.place_order) and storefront/dashboard reads against a local
+# SQLite file, comparing the previous SQLite settings with the WAL profile from database.py,
+# with and without the write-behind order writer (order_writer.py).
+#
+#   python benchmarks/concurrent_checkout_benchmark.py [seconds] [writers] [readers]
+
+PROFILES = {
+    # What the app ran with before: rollback journal, full fsync, pysqlite's default 5s wait
+    'rollback journal': {'SQLITE_JOURNAL_MODE': 'DELETE', 'SQLITE_SYNCHRONOUS': 'FULL',
+                         'SQLITE_BUSY_TIMEOUT_MS': 5000, 'SQLITE_MMAP_SIZE': 0},
+    'wal profile': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL',
+                    'SQLITE_BUSY_TIMEOUT_MS': 5000, 'SQLITE_MMAP_SIZE': 256 * 1024 * 1024},
+    'wal + order writer': {'SQLITE_JOURNAL_MODE': 'WAL', 'SQLITE_SYNCHRONOUS': 'NORMAL',
+                           'SQLITE_BUSY_TIMEOUT_MS': 5000, 'SQLITE_MMAP_SIZE': 256 * 1024 * 1024,
+                           'ORDER_WRITE_BEHIND': True},
+}
+
+SHIPPING = {'first_name': 'Load', 'last_name': 'Test', 'phone_number': '', 'email': '',
+            'address': '', 'city': '', 'state': 'MD', 'zip': ''}
+
+CART = [{'product_id': product_id, 'product_quantity': 1} for product_id in range(1, 6)]
+
+
+def create_bench_app(database_path, profile):
+    bench_app = Flask(__name__)
+    bench_app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+    bench_app.config.update(profile)
+    init_database(bench_app, db, default_uri='sqlite:///' + database_path)
+
+    with bench_app.app_context():
+        db.create_all()
+        db.session.add(User(username='load', first_name='Load', last_name='Test', email='load@example.com',
+                            password='', role='CUSTOMER'))
+        db.session.add(ProductCategory(category_id=1, category_name='Load'))
+        db.session.flush()
+        db.session.add(Customer(1))
+        for i in range(100):
+            db.session.add(Product(product_name=f'Product {i}', product_code=f'LOAD-{i}', product_description='',
+                                   product_image='', product_price=i + 0.99, category_id=1))
+        db.session.commit()
+
+    return bench_app
+
+
+def run_worker(bench_app, work, deadline, results):
+    with bench_app.app_context():
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                work()
+                results['latencies'].append(time.perf_counter() - started)
+            except OperationalError:
+                results['errors'] += 1
+            finally:
+                db.session.remove()
+
+
+def checkout(order_writer=None):
+    if order_writer:
+        order_writer.place_order(1, SHIPPING, CART)
+    else:
+        orders.place_order(1, SHIPPING, CART)
+
+
+def browse():
+    # Storefront pages come from the in-memory catalog snapshot and only read the shared catalog version
+    read_catalog_version()
+    rollups.orders_by_state().all()
+
+
+def run_profile(name, profile, seconds, writers, readers):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        bench_app = create_bench_app(os.path.join(tmp_dir, 'load.db'), profile)
+        order_writer = OrderWriter(bench_app) if profile.get('ORDER_WRITE_BEHIND') else None
+        write_results = [{'latencies': [], 'errors': 0} for _ in range(writers)]
+        read_results = [{'latencies': [], 'errors': 0} for _ in range(readers)]
+
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=run_worker, args=(bench_app, lambda: checkout(order_writer), deadline, each_result))
+                   for each_result in write_results]
+        threads += [threading.Thread(target=run_worker, args=(bench_app, browse, deadline, each_result))
+                    for each_result in read_results]
+        for each_thread in threads:
+            each_thread.start()
+        for each_thread in threads:
+            each_thread.join()
+
+        if order_writer:
+            order_writer.close()
+        with bench_app.app_context():
+            db.engine.dispose()
+
+    def summarize(results):
+        latencies = sorted(latency for each_result in results for latency in each_result['latencies'])
+        p95 = latencies[int(len(latencies) * 0.95)] * 1000 if latencies else 0.0
+        return len(latencies) / seconds, p95, sum(each_result['errors'] for each_result in results)
+
+    orders_per_second, checkout_p95, checkout_errors = summarize(write_results)
+    reads_per_second, read_p95, read_errors = summarize(read_results)
+    print(f'{name:<18}{orders_per_second:>10.1f}{checkout_p95:>12.1f}{checkout_errors:>8}'
+          f'{reads_per_second:>10.1f}{read_p95:>12.1f}{read_errors:>8}')
+
+
+def main(seconds=10, writers=8, readers=8):
+    print(f'{writers} checkout threads, {readers} reader threads, {seconds}s per profile')
+    print(f'{"profile":<18}{"orders/s":>10}{"p95 (ms)":>12}{"errors":>8}{"reads/s":>10}{"p95 (ms)":>12}{"errors":>8}')
+    for each_name, each_profile in PROFILES.items():
+        run_profile(each_name, each_profile, seconds, writers, readers)
+
+
+if __name__ == '__main__':
+    main(*(int(each_arg) for each_arg in sys.argv[1:4]))
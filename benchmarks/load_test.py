@@ -0,0 +1,271 @@
+import argparse
+import http.client
+import json
+import os
+import random
+import socket
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.cookies import SimpleCookie
+
+# Load test of the storefront, checkout and dashboard routes. Seeds a fresh SQLite database
+# with create_db.py, serves the real app from a threaded local WSGI server in a separate
+# process and drives it with concurrent clients, each keeping its own session cookie:
+#
+#   customers: login, then home -> product_view -> cart_add -> checkout -> process_order
+#   admins:    login, then analytics_dashboard -> home
+#
+# Reports requests/s and p50/p95/p99 latency per route. --save-baseline writes the results
+# as JSON; --baseline compares against such a file and exits with status 1 when a route's
+# p95 latency or throughput is worse than the baseline by more than --tolerance.
+#
+#   python benchmarks/load_test.py --orders 100000 --customers 16 --seconds 30 --save-baseline baseline.json
+#   python benchmarks/load_test.py --orders 100000 --customers 16 --seconds 30 --baseline baseline.json
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+SERVER = '''
+import logging
+from werkzeug.serving import make_server
+from app import app
+logging.getLogger('werkzeug').setLevel(logging.ERROR)
+server = make_server('127.0.0.1', {port}, app, threaded=True)
+print('ready', flush=True)
+server.serve_forever()
+'''
+
+USERS = {'customer': ('olive', 'olive'), 'admin': ('admin', 'adminpw')}
+
+SHIPPING = {'first_name': 'Load', 'last_name': 'Test', 'phone': '3015550100', 'email': 'load@example.com',
+            'address': '1 Load Test Way', 'city': 'College Park', 'state': 'MD', 'zip': '20742'}
+
+ROUTES = ['login', 'home', 'product_view', 'cart_add', 'checkout', 'process_order', 'analytics_dashboard']
+
+
+class Client:
+    # One browser: a keep-alive connection plus the cookies the app has set. Redirects are
+    # not followed, so every request is timed against the route that served it.
+
+    def __init__(self, port, recorder):
+        self.port = port
+        self.recorder = recorder
+        self.cookies = {}
+        self.connection = None
+
+    def request(self, route, method, path, form=None):
+        body = urllib.parse.urlencode(form) if form else None
+        headers = {'Cookie': '; '.join(f'{name}={value}' for name, value in self.cookies.items())}
+        if body:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        started = time.perf_counter()
+        try:
+            if self.connection is None:
+                self.connection = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            self.connection.request(method, path, body=body, headers=headers)
+            response = self.connection.getresponse()
+            response.read()
+        except (OSError, http.client.HTTPException):
+            self.recorder.record(route, time.perf_counter() - started, error=True)
+            self.close()
+            return None
+
+        self.recorder.record(route, time.perf_counter() - started, error=response.status >= 400)
+        for each_header in response.headers.get_all('Set-Cookie') or []:
+            for name, morsel in SimpleCookie(each_header).items():
+                self.cookies[name] = morsel.value
+        if response.will_close:
+            self.close()
+        return response
+
+    def login(self, role):
+        username, password = USERS[role]
+        self.request('login', 'POST', '/login', {'username': username, 'password': password})
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+            self.connection = None
+
+
+class Recorder:
+    # Latencies per route, only kept once the warm-up period is over
+
+    def __init__(self, record_from):
+        self.record_from = record_from
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def record(self, route, latency, error=False):
+        if time.perf_counter() < self.record_from:
+            return
+        with self._lock:
+            self.latencies.setdefault(route, []).append(latency)
+            if error:
+                self.errors[route] = self.errors.get(route, 0) + 1
+
+
+def run_customer(port, recorder, product_ids, deadline):
+    client = Client(port, recorder)
+    client.login('customer')
+    while time.perf_counter() < deadline:
+        product_id = random.choice(product_ids)
+        client.request('home', 'GET', '/')
+        client.request('product_view', 'GET', f'/product/{product_id}')
+        client.request('cart_add', 'POST', f'/cart/add/{product_id}', {'product_quantity': random.randint(1, 3)})
+        client.request('checkout', 'GET', '/checkout')
+        client.request('process_order', 'POST', '/process-order', SHIPPING)
+    client.close()
+
+
+def run_admin(port, recorder, product_ids, deadline):
+    client = Client(port, recorder)
+    client.login('admin')
+    while time.perf_counter() < deadline:
+        client.request('analytics_dashboard', 'GET', '/analytics-dashboard')
+        client.request('home', 'GET', '/')
+    client.close()
+
+
+def seed_database(database_path, args):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database_path)
+    subprocess.run([sys.executable, 'create_db.py', '--orders', str(args.orders), '--products', str(args.products),
+                    '--items-per-order', str(args.items_per_order)],
+                   cwd=basedir, env=env, check=True, stdout=subprocess.DEVNULL)
+
+    with sqlite3.connect(database_path) as connection:
+        return [each_row[0] for each_row in connection.execute('SELECT product_id FROM product')]
+
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+
+def start_server(database_path, port):
+    env = dict(os.environ, DATABASE_URL='sqlite:///' + database_path)
+    server = subprocess.Popen([sys.executable, '-c', SERVER.format(port=port)], cwd=basedir, env=env,
+                              stdout=subprocess.PIPE, text=True)
+    if server.stdout.readline().strip() != 'ready':
+        server.kill()
+        raise RuntimeError('The app server did not start')
+    return server
+
+
+def summarize(recorder, seconds):
+    results = {}
+    for each_route in ROUTES:
+        latencies = recorder.latencies.get(each_route)
+        if not latencies:
+            continue
+        # 99 cut points: index 49 is p50, 94 is p95 and 98 is p99
+        cut_points = statistics.quantiles(latencies, n=100, method='inclusive') if len(latencies) > 1 else latencies * 99
+        results[each_route] = {
+            'requests': len(latencies),
+            'errors': recorder.errors.get(each_route, 0),
+            'rps': len(latencies) / seconds,
+            'p50_ms': cut_points[49] * 1000,
+            'p95_ms': cut_points[94] * 1000,
+            'p99_ms': cut_points[98] * 1000,
+        }
+    return results
+
+
+def print_results(results):
+    print(f'{"route":<22}{"requests":>10}{"errors":>8}{"req/s":>10}{"p50 (ms)":>11}{"p95 (ms)":>11}{"p99 (ms)":>11}')
+    for each_route, each_result in results.items():
+        print(f'{each_route:<22}{each_result["requests"]:>10}{each_result["errors"]:>8}{each_result["rps"]:>10.1f}'
+              f'{each_result["p50_ms"]:>11.1f}{each_result["p95_ms"]:>11.1f}{each_result["p99_ms"]:>11.1f}')
+
+
+def compare_with_baseline(results, settings, baseline, tolerance):
+    # Returns the regressions found; routes missing from either run are skipped
+    if baseline['settings'] != settings:
+        print(f'warning: baseline was recorded with different settings: {baseline["settings"]}')
+
+    regressions = []
+    print(f'\n{"route":<22}{"p95 (ms)":>20}{"req/s":>20}')
+    for each_route, each_result in results.items():
+        baseline_result = baseline['routes'].get(each_route)
+        if not baseline_result:
+            continue
+
+        slower = each_result['p95_ms'] > baseline_result['p95_ms'] * (1 + tolerance)
+        fewer = each_result['rps'] < baseline_result['rps'] * (1 - tolerance)
+        p95_change = f'{baseline_result["p95_ms"]:.1f} -> {each_result["p95_ms"]:.1f}'
+        rps_change = f'{baseline_result["rps"]:.1f} -> {each_result["rps"]:.1f}'
+        print(f'{each_route:<22}{p95_change:>20}{rps_change:>20}  {"REGRESSION" if slower or fewer else "ok"}')
+
+        if slower or fewer:
+            regressions.append(each_route)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the store through a local WSGI server.')
+    parser.add_argument('--orders', type=int, default=20000, help='fake orders seeded by create_db.py')
+    parser.add_argument('--products', type=int, default=44, help='fake products seeded by create_db.py')
+    parser.add_argument('--items-per-order', type=int, default=3, help='maximum fake order items per order')
+    parser.add_argument('--customers', type=int, default=8, help='concurrent customer clients')
+    parser.add_argument('--admins', type=int, default=1, help='concurrent dashboard clients')
+    parser.add_argument('--seconds', type=float, default=20, help='measured duration')
+    parser.add_argument('--warmup', type=float, default=3, help='seconds of load before measuring starts')
+    parser.add_argument('--baseline', help='JSON results to compare against')
+    parser.add_argument('--save-baseline', help='write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed fractional p95/throughput change')
+    args = parser.parse_args()
+
+    settings = {'orders': args.orders, 'products': args.products, 'items_per_order': args.items_per_order,
+                'customers': args.customers, 'admins': args.admins, 'seconds': args.seconds}
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        database_path = os.path.join(tmp_dir, 'load.db')
+        print(f'Seeding {args.orders} orders and {args.products} fake products ...')
+        product_ids = seed_database(database_path, args)
+
+        port = free_port()
+        server = start_server(database_path, port)
+        try:
+            started = time.perf_counter()
+            recorder = Recorder(record_from=started + args.warmup)
+            deadline = started + args.warmup + args.seconds
+
+            threads = [threading.Thread(target=run_customer, args=(port, recorder, product_ids, deadline))
+                       for _ in range(args.customers)]
+            threads += [threading.Thread(target=run_admin, args=(port, recorder, product_ids, deadline))
+                        for _ in range(args.admins)]
+            for each_thread in threads:
+                each_thread.start()
+            for each_thread in threads:
+                each_thread.join()
+        finally:
+            server.terminate()
+            server.wait()
+
+    print(f'{args.customers} customers, {args.admins} admins, {args.seconds:g}s measured after {args.warmup:g}s warm-up')
+    results = summarize(recorder, args.seconds)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as baseline_file:
+            json.dump({'settings': settings, 'routes': results}, baseline_file, indent=2)
+        print(f'\nBaseline written to {args.save_baseline}')
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_with_baseline(results, settings, json.load(baseline_file), args.tolerance)
+        if regressions:
+            print(f'\nRegressions beyond {args.tolerance:.0%}: {", ".join(regressions)}')
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
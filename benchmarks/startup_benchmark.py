@@ -0,0 +1,50 @@
+import os
+import statistics
+import subprocess
+import sys
+
+# Measures how long a fresh worker takes to import the app and how much memory it holds
+# afterwards, with and without the analytics stack loaded.
+#
+#   python benchmarks/startup_benchmark.py [runs]
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PROBE = '''
+import resource, sys, time
+start = time.perf_counter()
+import app
+{extra_imports}
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+loaded = ','.join(name for name in ('pandas', 'plotly') if name in sys.modules) or '-'
+print(f'{{elapsed}} {{rss_kb}} {{loaded}}')
+'''
+
+SCENARIOS = {
+    # Previous behaviour: every worker imported pandas and plotly along with the app
+    'eager analytics imports': ('1', 'import pandas, plotly.express'),
+    'analytics enabled (lazy)': ('1', ''),
+    'analytics disabled': ('0', ''),
+}
+
+
+def run_probe(analytics_enabled, extra_imports):
+    env = dict(os.environ, ANALYTICS_ENABLED=analytics_enabled)
+    output = subprocess.run([sys.executable, '-c', PROBE.format(extra_imports=extra_imports)],
+                            cwd=basedir, env=env, capture_output=True, text=True, check=True).stdout
+    elapsed, rss_kb, loaded = output.split()
+    return float(elapsed), int(rss_kb), loaded
+
+
+def main(runs=5):
+    print(f'{"scenario":<28}{"import (ms)":>14}{"max RSS (MB)":>16}  modules loaded')
+    for each_scenario, (analytics_enabled, extra_imports) in SCENARIOS.items():
+        results = [run_probe(analytics_enabled, extra_imports) for _ in range(runs)]
+        elapsed = statistics.median(each_result[0] for each_result in results) * 1000
+        rss_mb = statistics.median(each_result[1] for each_result in results) / 1024
+        print(f'{each_scenario:<28}{elapsed:>14.1f}{rss_mb:>16.1f}  {results[-1][2]}')
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,145 @@
+import datetime as dt
+import random
+import time
+from contextlib import contextmanager
+from models import db, Product, StoreOrder, OrderItem
+
+
+# Batched loaders for building large test databases. Rows are generated lazily and written
+# with one executemany per batch through the DBAPI connection, skipping the ORM entirely.
+
+# Trades durability for speed while loading; a crash mid-load simply means re-running the load
+SQLITE_LOAD_PRAGMAS = {
+    'journal_mode': 'OFF',
+    'synchronous': 'OFF',
+    'temp_store': 'MEMORY',
+    'cache_size': '-262144',  # 256 MB
+    'locking_mode': 'EXCLUSIVE',
+}
+
+
+
+def _placeholder(connection):
+    return '?' if connection.dialect.paramstyle == 'qmark' else '%s'
+
+
+def _batches(rows, batch_size):
+    batch = []
+    for each_row in rows:
+        batch.append(each_row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+@contextmanager
+def load_connection():
+    # A raw connection with the fast load pragmas applied (SQLite only) for the duration of the load
+    with db.engine.connect() as connection:
+        is_sqlite = connection.dialect.name == 'sqlite'
+        if is_sqlite:
+            # Remember the connection's own settings (see database.py) to put back afterwards
+            restore_pragmas = {each_pragma: connection.exec_driver_sql(f'PRAGMA {each_pragma}').scalar()
+                               for each_pragma in ('journal_mode', 'synchronous', 'locking_mode')}
+            for each_pragma, value in SQLITE_LOAD_PRAGMAS.items():
+                connection.exec_driver_sql(f'PRAGMA {each_pragma}={value}')
+        try:
+            yield connection
+        finally:
+            if connection.in_transaction():
+                connection.rollback()
+            if is_sqlite:
+                for each_pragma, value in reversed(restore_pragmas.items()):
+                    connection.exec_driver_sql(f'PRAGMA {each_pragma}={value}')
+                # The exclusive lock is only released by the next read after switching back to NORMAL
+                connection.exec_driver_sql('SELECT count(*) FROM sqlite_master').all()
+
+
+@contextmanager
+def deferred_indexes(connection, tables):
+    # Drops the secondary indexes of the given tables for the load and builds them once at the end,
+    # which is much cheaper than maintaining them row by row
+    indexes = [each_index for each_table in tables for each_index in each_table.indexes]
+    for each_index in indexes:
+        each_index.drop(connection, checkfirst=True)
+    connection.commit()
+    try:
+        yield
+    finally:
+        for each_index in indexes:
+            each_index.create(connection, checkfirst=True)
+        connection.commit()
+
+
+def insert_rows(connection, table, columns, rows, batch_size):
+    sql = f'INSERT INTO {table.name} ({", ".join(columns)}) ' \
+          f'VALUES ({", ".join([_placeholder(connection)] * len(columns))})'
+
+    row_count = 0
+    for each_batch in _batches(rows, batch_size):
+        connection.exec_driver_sql(sql, each_batch)
+        connection.commit()
+        row_count += len(each_batch)
+    return row_count
+
+
+def fake_products(count, category_ids, start_id):
+    for i in range(1, count + 1):
+        yield (start_id + i - 1, 'Fake Product' + str(i), 'PROD-F' + str(i), '', '',
+               float(random.randrange(1, 250)), random.choice(category_ids))
+
+
+def fake_orders(count, customer_id, states, start_id, start_date, end_date):
+    span_seconds = (end_date - start_date).total_seconds()
+    for i in range(count):
+        order_date = start_date + dt.timedelta(seconds=random.random() * span_seconds)
+        yield (start_id + i, str(order_date), customer_id, 'Fake', 'Order', '', '', '', '',
+               random.choice(states), '', 'PENDING PAYMENT')
+
+
+def fake_order_items(order_ids, product_prices, max_items_per_order, max_quantity=3):
+    product_ids = list(product_prices)
+    for each_order_id in order_ids:
+        for each_product_id in random.sample(product_ids, random.randint(1, min(max_items_per_order, len(product_ids)))):
+            quantity = random.randint(1, max_quantity)
+            yield (each_order_id, each_product_id, quantity, product_prices[each_product_id] * quantity)
+
+
+def _next_id(connection, column):
+    return (connection.execute(db.select(db.func.max(column))).scalar() or 0) + 1
+
+
+def load_fake_data(order_count, product_count, category_ids, states, customer_id=1, max_items_per_order=3,
+                   batch_size=50000, days=366, log=print):
+    end_date = dt.datetime.now() - dt.timedelta(days=1)
+    start_date = end_date - dt.timedelta(days=days - 1)
+
+    with load_connection() as connection, \
+            deferred_indexes(connection, [Product.__table__, StoreOrder.__table__, OrderItem.__table__]):
+        started = time.perf_counter()
+        product_start_id = _next_id(connection, Product.product_id)
+        inserted = insert_rows(connection, Product.__table__,
+                               ['product_id', 'product_name', 'product_code', 'product_description',
+                                'product_image', 'product_price', 'category_id'],
+                               fake_products(product_count, category_ids, product_start_id), batch_size)
+        log(f'{inserted} products inserted in {time.perf_counter() - started:.1f}s')
+
+        started = time.perf_counter()
+        order_start_id = _next_id(connection, StoreOrder.order_id)
+        inserted = insert_rows(connection, StoreOrder.__table__,
+                               ['order_id', 'order_date', 'customer_id', 'first_name', 'last_name', 'phone_number',
+                                'email', 'address', 'city', 'state', 'zip', 'status'],
+                               fake_orders(order_count, customer_id, states, order_start_id, start_date, end_date),
+                               batch_size)
+        log(f'{inserted} orders inserted in {time.perf_counter() - started:.1f}s')
+
+        if max_items_per_order > 0:
+            started = time.perf_counter()
+            product_prices = dict(connection.execute(db.select(Product.product_id, Product.product_price)).all())
+            order_ids = range(order_start_id, order_start_id + order_count)
+            inserted = insert_rows(connection, OrderItem.__table__,
+                                   ['order_id', 'product_id', 'quantity', 'price_charged'],
+                                   fake_order_items(order_ids, product_prices, max_items_per_order), batch_size)
+            log(f'{inserted} order items inserted in {time.perf_counter() - started:.1f}s')
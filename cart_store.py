@@ -0,0 +1,192 @@
+import datetime as dt
+import threading
+from collections import OrderedDict
+from sqlalchemy import select, update, delete, func
+from models import db, Cart, CartItem
+import rollups
+
+
+# Server-side cart backends. Items are keyed by product_id and each cart keeps a running
+# total, so adding or removing an item never walks the whole cart. Both backends store
+# items as dicts shaped like the entries of the old session['cart'] list.
+
+class MemoryCartStore:
+    # Per-process carts, evicting the least recently used cart beyond max_carts.
+    # Only suitable for a single worker process.
+
+    def __init__(self, max_carts=10000):
+        self.max_carts = max_carts
+        self._carts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cart(self, cart_id, create=False):
+        cart = self._carts.get(cart_id)
+        if cart is not None:
+            self._carts.move_to_end(cart_id)
+        elif create:
+            cart = self._carts[cart_id] = {'items': {}, 'total': 0.0}
+            while len(self._carts) > self.max_carts:
+                self._carts.popitem(last=False)
+        return cart
+
+    def items(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return [dict(each_item) for each_item in cart['items'].values()] if cart else []
+
+    def count(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return len(cart['items']) if cart else 0
+
+    def total(self, cart_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            return cart['total'] if cart else 0.0
+
+    def add_item(self, cart_id, product, quantity, max_quantity):
+        # Returns the resulting quantity and whether it had to be capped at max_quantity
+        with self._lock:
+            cart = self._cart(cart_id, create=True)
+            item = cart['items'].get(product.product_id)
+            if item is None:
+                item = cart['items'][product.product_id] = {
+                    'product_id': product.product_id, 'product_name': product.product_name,
+                    'product_image': product.product_image, 'product_quantity': 0,
+                    'product_price': product.product_price}
+
+            new_quantity = min(item['product_quantity'] + quantity, max_quantity)
+            capped = item['product_quantity'] + quantity > max_quantity
+            cart['total'] += item['product_price'] * (new_quantity - item['product_quantity'])
+            item['product_quantity'] = new_quantity
+            return new_quantity, capped
+
+    def remove_item(self, cart_id, product_id):
+        with self._lock:
+            cart = self._cart(cart_id)
+            item = cart['items'].pop(product_id, None) if cart else None
+            if item:
+                cart['total'] -= item['product_price'] * item['product_quantity']
+            return item
+
+    def clear(self, cart_id):
+        with self._lock:
+            return self._carts.pop(cart_id, None) is not None
+
+
+class DatabaseCartStore:
+    # Carts kept in the cart/cart_item tables, shared by every worker using the same database
+
+    def __init__(self, session=None):
+        self._session = session
+
+    @property
+    def session(self):
+        return self._session or db.session
+
+    def items(self, cart_id):
+        cart_items = CartItem.query.filter_by(cart_id=cart_id).order_by(CartItem.added_at).all()
+        return [each_item.to_dict() for each_item in cart_items]
+
+    def count(self, cart_id):
+        return CartItem.query.filter_by(cart_id=cart_id).count()
+
+    def total(self, cart_id):
+        cart = self.session.get(Cart, cart_id)
+        return cart.cart_total if cart else 0.0
+
+    def _insert_missing(self, model, row):
+        # Inserts the row unless one with the same key exists; two requests may race to create it
+        dialect_insert = rollups.upsert_insert(self.session)
+        if dialect_insert:
+            self.session.execute(dialect_insert(model).values(**row).on_conflict_do_nothing())
+        elif self.session.get(model, tuple(row[each_key.name] for each_key in model.__table__.primary_key)) is None:
+            self.session.add(model(**row))
+            self.session.flush()
+
+    def _update_total(self, cart_id):
+        # Recomputed from the items rather than adjusted, so concurrent changes cannot leave it wrong
+        self.session.execute(update(Cart).where(Cart.cart_id == cart_id).values(cart_total=(
+            select(func.coalesce(func.sum(CartItem.product_price * CartItem.product_quantity), 0))
+            .where(CartItem.cart_id == cart_id).scalar_subquery())))
+
+    def add_item(self, cart_id, product, quantity, max_quantity):
+        # Each statement changes the rows in place (no read-modify-write), so adds to the same
+        # cart from two requests both count
+        item_key = (CartItem.cart_id == cart_id) & (CartItem.product_id == product.product_id)
+        try:
+            self._insert_missing(Cart, {'cart_id': cart_id, 'cart_total': 0})
+            self._insert_missing(CartItem, {'cart_id': cart_id, 'product_id': product.product_id,
+                                            'product_name': product.product_name, 'product_image': product.product_image,
+                                            'product_price': product.product_price, 'product_quantity': 0})
+
+            added = self.session.execute(update(CartItem)
+                                         .where(item_key, CartItem.product_quantity + quantity <= max_quantity)
+                                         .values(product_quantity=CartItem.product_quantity + quantity)).rowcount
+            capped = not added
+            if capped:
+                self.session.execute(update(CartItem).where(item_key).values(product_quantity=max_quantity))
+
+            new_quantity = self.session.execute(select(CartItem.product_quantity).where(item_key)).scalar()
+            self._update_total(cart_id)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        return new_quantity, capped
+
+    def remove_item(self, cart_id, product_id):
+        item = self.session.get(CartItem, (cart_id, product_id))
+        if item is None:
+            return None
+
+        removed = item.to_dict()
+        try:
+            deleted = self.session.execute(delete(CartItem).where(CartItem.cart_id == cart_id,
+                                                                  CartItem.product_id == product_id)).rowcount
+            self._update_total(cart_id)
+            self.session.commit()
+        except Exception:
+            self.session.rollback()
+            raise
+        # Another request may have removed it first
+        return removed if deleted else None
+
+    def clear(self, cart_id):
+        deleted = CartItem.query.filter_by(cart_id=cart_id).delete()
+        Cart.query.filter_by(cart_id=cart_id).delete()
+        self.session.commit()
+        return deleted > 0
+
+    def purge_expired(self, before, batch_size=1000):
+        # Deletes carts (and their items) last changed before the given datetime, one transaction
+        # per batch so checkouts are not held up behind one long delete. Returns the number deleted.
+        purged = 0
+        while True:
+            cart_ids = self.session.execute(
+                select(Cart.cart_id).where(Cart.updated_at < before).limit(batch_size)).scalars().all()
+            if not cart_ids:
+                return purged
+
+            self.session.execute(delete(CartItem).where(CartItem.cart_id.in_(cart_ids)))
+            self.session.execute(delete(Cart).where(Cart.cart_id.in_(cart_ids)))
+            self.session.commit()
+            purged += len(cart_ids)
+
+
+CART_STORES = {
+    'memory': MemoryCartStore,
+    'database': DatabaseCartStore,
+}
+
+
+def create_cart_store(backend):
+    try:
+        return CART_STORES[backend]()
+    except KeyError:
+        raise ValueError(f'Unknown cart store backend: {backend}')
+
+
+def cart_expiry_cutoff(days):
+    # Carts last changed before this datetime are abandoned
+    return dt.datetime.now() - dt.timedelta(days=days)
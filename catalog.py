@@ -0,0 +1,30 @@
+import base64
+import json
+
+
+# Keyset pagination of the product catalog ordered by (product_name, product_id). Pages are
+# addressed by an opaque cursor holding the sort key of the row they start after (or end
+# before); they are cut from the in-memory catalog snapshot (see catalog_snapshot.py).
+
+def encode_cursor(product):
+    key = json.dumps([product.product_name, product.product_id])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        product_name, product_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        return str(product_name), int(product_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def page_arguments(args, default_page_size, max_page_size):
+    # Reads the paging and filtering query string arguments shared by the catalog pages
+    page_size = args.get('page_size', default_page_size, type=int)
+    return {
+        'after': args.get('after'),
+        'before': args.get('before'),
+        'category_id': args.get('category', type=int),
+        'page_size': max(1, min(page_size, max_page_size)),
+    }
@@ -0,0 +1,214 @@
+import csv
+import json
+import math
+from sqlalchemy import select, insert, update
+from models import db, Product, ProductCategory
+from catalog_snapshot import bump_catalog_version
+
+
+# Bulk product import from CSV or JSONL. Rows are read one at a time from the upload, checked
+# against the product categories (loaded once per import) and upserted by product_code in
+# batches, one transaction per batch: a single IN (...) lookup finds which codes already
+# exist, then the batch is written with one executemany UPDATE and one executemany INSERT.
+# Rows that fail are reported by line number and skipped; the rest of the file still imports.
+#
+# Columns: product_code (required), product_name, category_id or category_name,
+# product_price, product_description. Only the columns given (and not blank) are changed on
+# existing products; new products need a name, a category and a price.
+
+IMPORT_FORMATS = ['csv', 'jsonl']
+
+REQUIRED_FOR_NEW = {'product_name', 'category_id', 'product_price'}
+NEW_PRODUCT_DEFAULTS = {'product_description': '', 'product_image': ''}
+
+MAX_LENGTHS = {'product_code': 30, 'product_name': 100}
+
+
+class ImportReport:
+
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.updated = 0
+        self.errors = []
+
+    def error(self, line_number, product_code, message):
+        self.errors.append({'line': line_number, 'product_code': product_code, 'error': message})
+
+    def __repr__(self):
+        return f"{self.rows} rows: {self.inserted} inserted, {self.updated} updated, {len(self.errors)} errors"
+
+
+def _text_lines(stream):
+    # Decoded one line at a time, so a decoding error is reported on the line that has it
+    for line_number, line in enumerate(stream, start=1):
+        yield line.decode('utf-8-sig' if line_number == 1 else 'utf-8')
+
+
+def csv_rows(stream):
+    # Yields (line number, row dict); the header is line 1. A line that is not UTF-8 is reported
+    # as (line number, error message) and ends the file.
+    reader = csv.DictReader(_text_lines(stream))
+    try:
+        for row_number, row in enumerate(reader, start=2):
+            yield row_number, row
+    except UnicodeDecodeError:
+        yield reader.line_num + 1, 'file is not UTF-8'
+
+
+def jsonl_rows(stream):
+    # Yields (line number, row dict), or (line number, error message) for lines that are not a JSON object
+    for line_number, line in enumerate(stream, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line.decode('utf-8-sig' if line_number == 1 else 'utf-8'))
+        except UnicodeDecodeError:
+            yield line_number, 'file is not UTF-8'
+            continue
+        except ValueError as e:
+            yield line_number, f'Invalid JSON: {e}'
+            continue
+        yield line_number, row if isinstance(row, dict) else 'Expected a JSON object'
+
+
+IMPORT_READERS = {
+    'csv': csv_rows,
+    'jsonl': jsonl_rows,
+}
+
+
+def import_format(filename):
+    # Guess the format from a file name, e.g. products.jsonl -> 'jsonl'
+    extension = filename.rsplit('.', 1)[-1].lower() if '.' in filename else ''
+    if extension == 'ndjson':
+        return 'jsonl'
+    return extension if extension in IMPORT_FORMATS else None
+
+
+def _text(value):
+    return '' if value is None else str(value).strip()
+
+
+def clean_row(row, category_ids, category_names):
+    # Returns (product_code, column values) or raises ValueError with a message for the report
+    product_code = _text(row.get('product_code'))
+    if not product_code:
+        raise ValueError('product_code is required')
+
+    # Blank values keep the current ones: a CSV file has every column on every row
+    values = {}
+    if _text(row.get('product_name')):
+        values['product_name'] = _text(row['product_name'])
+    if _text(row.get('product_description')):
+        values['product_description'] = _text(row['product_description'])
+
+    if _text(row.get('product_price')):
+        try:
+            product_price = float(row['product_price'])
+        except (TypeError, ValueError):
+            product_price = None
+        # float() also accepts 'nan' and 'inf'
+        if product_price is None or not math.isfinite(product_price):
+            raise ValueError(f'product_price is not a number: {row["product_price"]!r}')
+        values['product_price'] = round(product_price, 2)
+        if values['product_price'] < 0:
+            raise ValueError('product_price cannot be negative')
+
+    if _text(row.get('category_id')):
+        try:
+            category_id = int(row['category_id'])
+        except (TypeError, ValueError):
+            category_id = None
+        if category_id not in category_ids:
+            raise ValueError(f'Unknown category_id: {row["category_id"]!r}')
+        values['category_id'] = category_id
+    elif _text(row.get('category_name')):
+        category_id = category_names.get(_text(row['category_name']).lower())
+        if category_id is None:
+            raise ValueError(f'Unknown category_name: {row["category_name"]!r}')
+        values['category_id'] = category_id
+
+    lengths = {'product_code': len(product_code), 'product_name': len(values.get('product_name', ''))}
+    for each_column, max_length in MAX_LENGTHS.items():
+        if lengths[each_column] > max_length:
+            raise ValueError(f'{each_column} is longer than {max_length} characters')
+
+    return product_code, values
+
+
+def _write_batch(batch, report, session):
+    # batch maps product_code -> (line number, column values); later rows for a code were merged in
+    existing_ids = {}
+    for product_id, product_code in session.execute(
+            select(Product.product_id, Product.product_code).where(Product.product_code.in_(batch.keys()))):
+        existing_ids.setdefault(product_code, []).append(product_id)
+
+    updates, inserts = [], []
+    for product_code, (line_number, values) in batch.items():
+        if product_code in existing_ids:
+            if values:
+                updates.extend(dict(values, product_id=product_id) for product_id in existing_ids[product_code])
+            continue
+
+        missing_columns = REQUIRED_FOR_NEW - values.keys()
+        if missing_columns:
+            report.error(line_number, product_code, f'New product is missing {", ".join(sorted(missing_columns))}')
+        else:
+            inserts.append(dict(NEW_PRODUCT_DEFAULTS, product_code=product_code, **values))
+
+    try:
+        if updates:
+            session.execute(update(Product), updates)
+        if inserts:
+            session.execute(insert(Product), inserts)
+        if updates or inserts:
+            bump_catalog_version(session)
+        session.commit()
+    except Exception as e:
+        session.rollback()
+        for product_code, (line_number, _) in batch.items():
+            report.error(line_number, product_code, f'Batch could not be written: {e}')
+        return
+
+    report.updated += len(updates)
+    report.inserted += len(inserts)
+
+
+def import_products(rows, batch_size=1000, session=None):
+    # rows are (line number, row dict or error message) pairs from one of the IMPORT_READERS
+    session = session or db.session
+    report = ImportReport()
+
+    categories = session.execute(select(ProductCategory.category_id, ProductCategory.category_name)).all()
+    category_ids = {category_id for category_id, _ in categories}
+    category_names = {category_name.lower(): category_id for category_id, category_name in categories}
+
+    batch = {}
+    for line_number, row in rows:
+        report.rows += 1
+        if isinstance(row, str):
+            report.error(line_number, '', row)
+            continue
+
+        try:
+            product_code, values = clean_row(row, category_ids, category_names)
+        except ValueError as e:
+            report.error(line_number, _text(row.get('product_code')), str(e))
+            continue
+
+        # A code repeated within a batch is written once, with the later rows' values on top
+        if product_code in batch:
+            values = dict(batch[product_code][1], **values)
+        batch[product_code] = (line_number, values)
+
+        if len(batch) >= batch_size:
+            _write_batch(batch, report, session)
+            batch = {}
+
+    if batch:
+        _write_batch(batch, report, session)
+
+    # Errors found while writing a batch come after the row errors before it
+    report.errors.sort(key=lambda each_error: each_error['line'])
+    return report
@@ -0,0 +1,171 @@
+import bisect
+import threading
+import time
+from collections import namedtuple
+from sqlalchemy import event, select, update, insert
+from sqlalchemy.orm import Session, object_session
+from models import db, Product, ProductCategory, CatalogVersion
+from catalog import encode_cursor, decode_cursor
+
+
+# Read-only, in-process copy of the product catalog for the storefront. A snapshot is built
+# in one pass over product and product_category and never modified afterwards; a refresh
+# builds a new snapshot and swaps the reference, so readers never see a half built catalog
+# and never take a lock. Product and category changes made through the ORM bump the shared
+# catalog_version row in the same transaction, and each worker compares that version with
+# its snapshot at most once every check_interval seconds.
+
+class _Record(tuple):
+    # Fields read as attributes or, like the ORM objects the templates were written for, by name
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return getattr(self, key)
+        return tuple.__getitem__(self, key)
+
+
+class ProductRecord(_Record, namedtuple('ProductRecord', ['product_id', 'category_id', 'product_name', 'product_code',
+                                                          'product_description', 'product_image', 'product_price'])):
+    __slots__ = ()
+
+
+class CategoryRecord(_Record, namedtuple('CategoryRecord', ['category_id', 'category_name'])):
+    __slots__ = ()
+
+
+def _sort_key(product):
+    # Catalog pages are ordered by name, then id (see catalog.py)
+    return (product.product_name, product.product_id)
+
+
+class CatalogSnapshot:
+
+    def __init__(self, version, products, categories):
+        self.version = version
+        self.products = {each_product.product_id: each_product for each_product in products}
+        self.categories = tuple(sorted(categories, key=lambda each_category: each_category.category_name))
+
+        # Name sorted index of the whole catalog (None) and of each category, with their sort keys for bisect
+        by_name = sorted(products, key=_sort_key)
+        by_category = {}
+        for each_product in by_name:
+            by_category.setdefault(each_product.category_id, []).append(each_product)
+        by_category[None] = by_name
+
+        self._indexes = {category_id: ([_sort_key(each_product) for each_product in category_products], tuple(category_products))
+                         for category_id, category_products in by_category.items()}
+
+    def product(self, product_id):
+        return self.products.get(product_id)
+
+    def product_page(self, after=None, before=None, category_id=None, page_size=24):
+        # Keyset page of the catalog (or of one category), found by bisect on the name index
+        keys, products = self._indexes.get(category_id or None, ((), ()))
+
+        after_key = decode_cursor(after) if after else None
+        before_key = decode_cursor(before) if before else None
+
+        if before_key:
+            end = bisect.bisect_left(keys, before_key)
+            start = max(0, end - page_size)
+            has_previous, has_next = start > 0, True
+        else:
+            start = bisect.bisect_right(keys, after_key) if after_key else 0
+            end = start + page_size
+            has_previous, has_next = after_key is not None, end < len(products)
+
+        page = list(products[start:end])
+
+        return {
+            'products': page,
+            'next_cursor': encode_cursor(page[-1]) if page and has_next else None,
+            'previous_cursor': encode_cursor(page[0]) if page and has_previous else None,
+        }
+
+
+def read_catalog_version(session=None):
+    session = session or db.session
+    return session.execute(select(CatalogVersion.version).where(CatalogVersion.catalog_version_id == 1)).scalar() or 0
+
+
+def bump_catalog_version(connection=None):
+    # Runs inside the transaction that changes the catalog; bulk writes that bypass the ORM call it directly
+    connection = connection or db.session
+    bumped = connection.execute(update(CatalogVersion).where(CatalogVersion.catalog_version_id == 1)
+                             .values(version=CatalogVersion.version + 1))
+    if not bumped.rowcount:
+        connection.execute(insert(CatalogVersion).values(catalog_version_id=1, version=1))
+
+
+def load_catalog_snapshot(session=None):
+    # The version is read first, so the rows loaded are at least as new as the version recorded
+    session = session or db.session
+    version = read_catalog_version(session)
+
+    products = [ProductRecord(*each_row) for each_row in session.execute(select(
+        Product.product_id, Product.category_id, Product.product_name, Product.product_code,
+        Product.product_description, Product.product_image, Product.product_price))]
+    categories = [CategoryRecord(*each_row) for each_row in session.execute(select(
+        ProductCategory.category_id, ProductCategory.category_name))]
+
+    return CatalogSnapshot(version, products, categories)
+
+
+class CatalogSnapshots:
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._stale = False
+        self._lock = threading.Lock()
+
+        for each_model in (Product, ProductCategory):
+            for each_event in ('after_insert', 'after_update', 'after_delete'):
+                event.listen(each_model, each_event, self._catalog_changed)
+        event.listen(Session, 'after_flush', self._after_flush)
+        event.listen(Session, 'after_commit', self._after_commit)
+        event.listen(Session, 'after_rollback', self._after_rollback)
+
+    def current(self, check=False):
+        # check=True always compares versions (e.g. before pricing an order) instead of trusting the interval
+        snapshot = self._snapshot
+        now = time.monotonic()
+        if snapshot is not None and not self._stale and not check and now - self._checked_at < self.check_interval:
+            return snapshot
+
+        version = read_catalog_version()
+        self._checked_at = now
+        if snapshot is not None and not self._stale and version == snapshot.version:
+            return snapshot
+
+        # One rebuild at a time; requests arriving meanwhile wait and then use the new snapshot
+        with self._lock:
+            snapshot = self._snapshot
+            if snapshot is None or self._stale or read_catalog_version() != snapshot.version:
+                self._stale = False
+                snapshot = self._snapshot = load_catalog_snapshot()
+        return snapshot
+
+    def invalidate(self):
+        self._stale = True
+
+    def _catalog_changed(self, mapper, connection, target):
+        session = object_session(target)
+        if session is not None:
+            session.info['catalog_flushed'] = True
+
+    def _after_flush(self, session, flush_context):
+        # Bump once per flush that wrote products or categories, in the same transaction
+        if session.info.pop('catalog_flushed', False):
+            bump_catalog_version(session.connection())
+            session.info['catalog_changed'] = True
+
+    def _after_commit(self, session):
+        if session.info.pop('catalog_changed', False):
+            self.invalidate()
+
+    def _after_rollback(self, session):
+        session.info.pop('catalog_flushed', None)
+        session.info.pop('catalog_changed', None)
@@ -0,0 +1,110 @@
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from flask import request
+import profiling
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; without it responses are only gzipped
+    brotli = None
+
+
+# Response compression. Text responses of at least min_size bytes are sent with brotli or
+# gzip, whichever the client accepts (brotli preferred). Streamed responses (server-sent
+# events, exports) and files sent straight from disk are left alone.
+#
+# Responses carrying an ETag (the analytics dashboard, cached storefront pages) are expected to
+# be sent again unchanged, so they are compressed once at a higher level and the result is kept
+# in a bounded LRU keyed by the body's digest; later requests for the same body reuse it.
+
+COMPRESSIBLE_MIMETYPES = {'text/html', 'text/css', 'text/plain', 'text/csv', 'text/javascript',
+                          'application/javascript', 'application/json', 'image/svg+xml'}
+
+# (level for one-off responses, level for cached payloads)
+GZIP_LEVELS = (6, 9)
+BROTLI_QUALITIES = (5, 9)
+
+
+def compress(data, encoding, cached=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITIES[cached])
+    return gzip.compress(data, compresslevel=GZIP_LEVELS[cached], mtime=0)
+
+
+def weaken_etag(response):
+    # A compressed body is a different representation from the identity one, so it cannot carry
+    # the same strong validator. If-None-Match uses weak comparison, so revalidation still works.
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        response.set_etag(etag, weak=True)
+
+
+class ResponseCompressor:
+    # Flask extension; enable with ResponseCompressor(app) or compressor.init_app(app)
+
+    def __init__(self, app=None, min_size=1024, max_entries=256):
+        self.min_size = min_size
+        self.max_entries = max_entries
+        self.encodings = ['br', 'gzip'] if brotli else ['gzip']
+        self._payloads = OrderedDict()
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['response_compressor'] = self
+        app.after_request(self._after_request)
+
+    def _cached_payload(self, data, encoding):
+        key = (encoding, hashlib.sha1(data).digest())
+        with self._lock:
+            if key in self._payloads:
+                self._payloads.move_to_end(key)
+                return self._payloads[key]
+
+        payload = compress(data, encoding, cached=True)
+
+        with self._lock:
+            self._payloads[key] = payload
+            while len(self._payloads) > self.max_entries:
+                self._payloads.popitem(last=False)
+        return payload
+
+    def _after_request(self, response):
+        if response.mimetype not in COMPRESSIBLE_MIMETYPES or response.is_streamed or response.direct_passthrough:
+            return response
+        # Compressed or not, the body now depends on Accept-Encoding
+        response.vary.add('Accept-Encoding')
+
+        if 'Content-Encoding' in response.headers:
+            return response
+        encoding = request.accept_encodings.best_match(self.encodings)
+        if encoding is None:
+            return response
+        if response.status_code == 304:
+            # Revalidating a compressed copy; send the validator the 200 response had
+            weaken_etag(response)
+            return response
+        if response.status_code != 200:
+            return response
+
+        data = response.get_data()
+        if len(data) < self.min_size:
+            return response
+
+        with profiling.track('compress'):
+            if response.get_etag()[0]:
+                payload = self._cached_payload(data, encoding)
+            else:
+                payload = compress(data, encoding)
+
+        response.set_data(payload)
+        response.headers['Content-Encoding'] = encoding
+        weaken_etag(response)
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._payloads.clear()
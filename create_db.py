@@ -1,11 +1,23 @@
+import argparse
 from app import app, db
-from models import Customer, User, Product, ProductCategory, StoreOrder
+from models import Customer, User, Product, ProductCategory
+import archive
+import bulk_load
+import rollups
+import search
 from werkzeug.security import generate_password_hash
-import random
-import datetime as dt
+
+parser = argparse.ArgumentParser(description='Create the store database and fill it with sample and fake data.')
+parser.add_argument('--orders', type=int, default=20000, help='number of fake orders to generate')
+parser.add_argument('--products', type=int, default=44, help='number of fake products to generate')
+parser.add_argument('--items-per-order', type=int, default=3, help='maximum fake order items per order (0 for none)')
+parser.add_argument('--batch-size', type=int, default=50000, help='rows written per INSERT batch')
+args = parser.parse_args()
 
 with app.app_context():
+    archive.drop_archive_tables()
     db.drop_all()
+    search.drop_search_index()
     db.create_all()
 
     # Initial loading of customers
@@ -17,14 +29,14 @@ with app.app_context():
         print(f'{each_customer["user_id"]} inserted into customer')
         a_customer = Customer(each_customer["user_id"])
         db.session.add(a_customer)
-        db.session.commit()
+    db.session.commit()
 
     # Initial loading of users
     users = [
         {'username': 'olive', 'email': 'opurchess@gmail.com', 'first_name':'Olive', 'last_name':'Perchases',
-            'password': generate_password_hash('olive', method='sha256'), 'role':'CUSTOMER'},
+            'password': generate_password_hash('olive'), 'role':'CUSTOMER'},
         {'username': 'admin', 'email': 'abyer@my-store.com', 'first_name':'Anita', 'last_name':'Byer',
-            'password': generate_password_hash('adminpw', method='sha256'), 'role':'ADMIN'}
+            'password': generate_password_hash('adminpw'), 'role':'ADMIN'}
     ]
 
     for each_user in users:
@@ -32,7 +44,7 @@ with app.app_context():
         a_user = User(username=each_user["username"], email=each_user["email"], first_name=each_user["first_name"],
                       last_name=each_user["last_name"], password=each_user["password"], role=each_user["role"])
         db.session.add(a_user)
-        db.session.commit()
+    db.session.commit()
 
     # Initial loading of product categories
     product_categories = [
@@ -50,7 +62,7 @@ with app.app_context():
         a_product_category = ProductCategory(category_id=each_product_category['category_id'],
                                              category_name=each_product_category['category_name'])
         db.session.add(a_product_category)
-        db.session.commit()
+    db.session.commit()
 
     # Initial loading of products
     products = [
@@ -71,25 +83,15 @@ with app.app_context():
                             product_description=each_product['product_description'], product_image=each_product['product_image'],
                             product_price=each_product['product_price'], category_id=each_product['category_id'])
         db.session.add(a_product)
-        db.session.commit()
-
-    # Insert fake orders for analytics
-    states = ['MD', 'DC', 'VA', 'TX', 'FL', 'NY', 'CA', 'DE']
-
-    start_date = dt.datetime.now() - dt.timedelta(days=366)
-    end_date = dt.datetime.now() - dt.timedelta(days=1)
-
-    for i in range(1, 20000):
-        an_order = StoreOrder(customer_id=1, first_name='Fake', last_name='Order', phone_number='', email='',
-                              address='', city='', state=random.choice(states), zip='', order_date=start_date + (end_date - start_date) * random.random())
-        db.session.add(an_order)
     db.session.commit()
 
-    # Insert fake products for analytics
+    # Insert fake products, orders and order items for analytics in batches
+    states = ['MD', 'DC', 'VA', 'TX', 'FL', 'NY', 'CA', 'DE']
     categories = [each_category['category_id'] for each_category in product_categories]
 
-    for i in range(1, 45):
-        a_product = Product(product_name='Fake Product' + str(i), product_code='PROD-F'+ str(i), product_description='',
-                            product_image='', product_price=random.randrange(1, 250), category_id=random.choice(categories))
-        db.session.add(a_product)
-    db.session.commit()
\ No newline at end of file
+    bulk_load.load_fake_data(order_count=args.orders, product_count=args.products, category_ids=categories,
+                             states=states, max_items_per_order=args.items_per_order, batch_size=args.batch_size)
+
+    # Build the dashboard rollups and the search index from the rows just inserted
+    rollups.rebuild_rollups()
+    search.create_search_index()
@@ -0,0 +1,109 @@
+import datetime as dt
+import json
+import threading
+import time
+from sqlalchemy import select, func
+from models import db, StoreOrder
+import rollups
+
+
+# Server-sent events for the analytics dashboard. A stream opens with a snapshot of the live
+# order series (per state, per month and the past 30 days, read from the rollups together with
+# the newest order id), then sends a small delta for the orders committed after that id. The
+# commit in process_order wakes the streams of this worker at once; orders committed by other
+# workers are picked up by polling the newest order id every poll_interval seconds. The page
+# patches its figures with those numbers instead of being reloaded.
+
+PAST_DAYS = 30
+
+
+class DashboardEvents:
+
+    def __init__(self, poll_interval=5, heartbeat_interval=15, max_duration=600):
+        self.poll_interval = poll_interval
+        self.heartbeat_interval = heartbeat_interval
+        # Streams end after this long; the browser reconnects and gets a fresh snapshot
+        self.max_duration = max_duration
+        self._generation = 0
+        self._changed = threading.Condition()
+
+    def publish(self):
+        # Called after orders are committed
+        with self._changed:
+            self._generation += 1
+            self._changed.notify_all()
+
+    def wait(self, generation, timeout):
+        # Returns the current generation once it moves past the given one, or after the timeout
+        with self._changed:
+            self._changed.wait_for(lambda: self._generation != generation, timeout=timeout)
+            return self._generation
+
+    def stream(self):
+        started = last_sent = time.monotonic()
+        generation = self._generation
+
+        with db.engine.connect() as connection:
+            snapshot = live_snapshot(connection)
+        last_order_id = snapshot['last_order_id']
+        yield sse_event('snapshot', snapshot, retry_ms=int(self.poll_interval * 1000))
+
+        while time.monotonic() - started < self.max_duration:
+            generation = self.wait(generation, timeout=self.poll_interval)
+
+            with db.engine.connect() as connection:
+                delta = order_delta(connection, last_order_id)
+
+            if delta:
+                last_order_id = delta['last_order_id']
+                last_sent = time.monotonic()
+                yield sse_event('orders', delta)
+            elif time.monotonic() - last_sent >= self.heartbeat_interval:
+                last_sent = time.monotonic()
+                yield ': keep-alive\n\n'
+
+
+def sse_event(name, data, retry_ms=None):
+    retry = f'retry: {retry_ms}\n' if retry_ms else ''
+    return f'{retry}event: {name}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+def _past_start_date():
+    return (dt.datetime.now() - dt.timedelta(days=PAST_DAYS)).date()
+
+
+def live_snapshot(connection):
+    # One read transaction, so the rollup totals and the newest order id agree
+    with connection.begin():
+        last_order_id = connection.execute(select(func.max(StoreOrder.order_id))).scalar() or 0
+        by_state = dict(connection.execute(rollups.orders_by_state().statement).all())
+        by_month = dict(connection.execute(rollups.orders_by_month().statement).all())
+        past_orders = connection.execute(rollups.orders_since(days=PAST_DAYS).statement).scalar()
+
+    return {'last_order_id': last_order_id, 'by_state': by_state, 'by_month': by_month, 'past_30': past_orders}
+
+
+def order_delta(connection, after_order_id, limit=1000):
+    # Orders committed after the given id, counted the same way as the rollups count them
+    new_orders = connection.execute(
+        select(StoreOrder.order_id, StoreOrder.order_date, StoreOrder.state)
+        .where(StoreOrder.order_id > after_order_id)
+        .order_by(StoreOrder.order_id)
+        .limit(limit)
+    ).all()
+    connection.rollback()
+    if not new_orders:
+        return None
+
+    past_start_date = _past_start_date()
+    by_state, by_month = {}, {}
+    past_orders = 0
+    for _, order_date, state in new_orders:
+        state = state or ''
+        month = order_date.strftime('%Y-%m')
+        by_state[state] = by_state.get(state, 0) + 1
+        by_month[month] = by_month.get(month, 0) + 1
+        past_orders += order_date.date() >= past_start_date
+
+    return {'last_order_id': new_orders[-1][0], 'orders': len(new_orders),
+            'by_state': by_state, 'by_month': by_month, 'past_30': past_orders}
@@ -0,0 +1,72 @@
+import os
+from sqlalchemy import event
+
+
+# Engine profile for the store database. DATABASE_URL selects the database; SQLite files get
+# per-connection pragmas so readers are not blocked by writers and a writer waits for the
+# lock instead of failing with "database is locked", while server databases get pool settings.
+
+def _env(name, default, cast=str):
+    value = os.environ.get(name)
+    return default if value is None else cast(value)
+
+
+def _env_flag(value):
+    return value.lower() in ('1', 'true', 'yes', 'on')
+
+
+def configure_database(app, default_uri):
+    app.config.setdefault('SQLALCHEMY_DATABASE_URI', _env('DATABASE_URL', default_uri))
+
+    # SQLite connection pragmas
+    app.config.setdefault('SQLITE_JOURNAL_MODE', _env('SQLITE_JOURNAL_MODE', 'WAL'))
+    app.config.setdefault('SQLITE_SYNCHRONOUS', _env('SQLITE_SYNCHRONOUS', 'NORMAL'))
+    app.config.setdefault('SQLITE_BUSY_TIMEOUT_MS', _env('SQLITE_BUSY_TIMEOUT_MS', 5000, int))
+    app.config.setdefault('SQLITE_MMAP_SIZE', _env('SQLITE_MMAP_SIZE', 256 * 1024 * 1024, int))
+
+    # Connection pool for server databases (PostgreSQL, MySQL, ...)
+    app.config.setdefault('DATABASE_POOL_SIZE', _env('DATABASE_POOL_SIZE', 10, int))
+    app.config.setdefault('DATABASE_MAX_OVERFLOW', _env('DATABASE_MAX_OVERFLOW', 20, int))
+    app.config.setdefault('DATABASE_POOL_PRE_PING', _env('DATABASE_POOL_PRE_PING', True, _env_flag))
+    app.config.setdefault('DATABASE_POOL_RECYCLE', _env('DATABASE_POOL_RECYCLE', 1800, int))
+
+    if is_sqlite_uri(app.config['SQLALCHEMY_DATABASE_URI']):
+        engine_options = {}
+    else:
+        engine_options = {
+            'pool_size': app.config['DATABASE_POOL_SIZE'],
+            'max_overflow': app.config['DATABASE_MAX_OVERFLOW'],
+            'pool_pre_ping': app.config['DATABASE_POOL_PRE_PING'],
+            'pool_recycle': app.config['DATABASE_POOL_RECYCLE'],
+        }
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options)
+
+
+def is_sqlite_uri(uri):
+    return uri.startswith('sqlite')
+
+
+def sqlite_pragmas(config):
+    return {
+        'journal_mode': config['SQLITE_JOURNAL_MODE'],
+        'synchronous': config['SQLITE_SYNCHRONOUS'],
+        'busy_timeout': config['SQLITE_BUSY_TIMEOUT_MS'],
+        'mmap_size': config['SQLITE_MMAP_SIZE'],
+    }
+
+
+def init_database(app, db, default_uri):
+    configure_database(app, default_uri)
+    db.init_app(app)
+
+    if is_sqlite_uri(app.config['SQLALCHEMY_DATABASE_URI']):
+        pragmas = sqlite_pragmas(app.config)
+
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for each_pragma, value in pragmas.items():
+                cursor.execute(f'PRAGMA {each_pragma}={value}')
+            cursor.close()
+
+        with app.app_context():
+            event.listen(db.engine, 'connect', set_sqlite_pragmas)
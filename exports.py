@@ -0,0 +1,175 @@
+import csv
+import datetime as dt
+import importlib.util
+import io
+from sqlalchemy import select, union_all
+from models import db, StoreOrder, OrderItem, Product
+import archive
+
+# Streaming exports of orders joined with their items and products. Rows are read through a
+# server-side cursor in batches and written out batch by batch, so memory use stays flat no
+# matter how many orders are exported. Orders moved out by archive-orders are read from the
+# per-year archive tables covering the requested dates, so an export still has every order.
+
+EXPORT_COLUMNS = [
+    ('order_id', StoreOrder.order_id),
+    ('order_date', StoreOrder.order_date),
+    ('customer_id', StoreOrder.customer_id),
+    ('state', StoreOrder.state),
+    ('status', StoreOrder.status),
+    ('order_item_id', OrderItem.order_item_id),
+    ('product_id', OrderItem.product_id),
+    ('product_code', Product.product_code),
+    ('product_name', Product.product_name),
+    ('quantity', OrderItem.quantity),
+    ('price_charged', OrderItem.price_charged),
+]
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+
+def parquet_available():
+    # pyarrow is optional; without it only CSV exports are available. It is only imported once a
+    # Parquet export starts, so workers do not load it (and numpy) at startup.
+    return importlib.util.find_spec('pyarrow') is not None
+
+
+def parse_date(value):
+    return dt.datetime.strptime(value, '%Y-%m-%d').date() if value else None
+
+
+def archive_years(connection, start_date=None, end_date=None):
+    # Years with both archive tables whose orders can fall between the two dates
+    names = set(archive.archive_table_names(connection))
+    years = {int(each_name[-4:]) for each_name in names if each_name.startswith('store_order_archive_')}
+    return sorted(year for year in years
+                  if f'order_item_archive_{year}' in names
+                  and (not start_date or year >= start_date.year) and (not end_date or year <= end_date.year))
+
+
+def _order_rows(order_table, item_table, start_date=None, end_date=None):
+    # EXPORT_COLUMNS name the live columns; take the same columns from the given tables instead
+    tables = {StoreOrder.__table__: order_table, OrderItem.__table__: item_table}
+    columns = [(name, column.expression) for name, column in EXPORT_COLUMNS]
+    query = select(*(tables.get(column.table, column.table).c[column.name].label(name) for name, column in columns)) \
+        .select_from(order_table) \
+        .join(item_table, item_table.c.order_id == order_table.c.order_id) \
+        .outerjoin(Product, Product.product_id == item_table.c.product_id)
+
+    if start_date:
+        query = query.where(order_table.c.order_date >= dt.datetime.combine(start_date, dt.time.min))
+    if end_date:
+        query = query.where(order_table.c.order_date < dt.datetime.combine(end_date + dt.timedelta(days=1), dt.time.min))
+    return query
+
+
+def export_query(start_date=None, end_date=None, years=()):
+    # Both dates are inclusive; years are the archive tables to read along with the live ones
+    queries = [_order_rows(StoreOrder.__table__, OrderItem.__table__, start_date, end_date)]
+    queries += [_order_rows(archive.archive_table(StoreOrder.__table__, year),
+                            archive.archive_table(OrderItem.__table__, year), start_date, end_date)
+                for year in years]
+
+    if len(queries) == 1:
+        return queries[0].order_by('order_id', 'order_item_id')
+    return union_all(*queries).order_by('order_id', 'order_item_id')
+
+
+def row_batches(start_date=None, end_date=None, batch_size=10000):
+    years = archive_years(db.session.connection(), start_date, end_date)
+    result = db.session.execute(export_query(start_date, end_date, years)
+                                .execution_options(stream_results=True, yield_per=batch_size))
+    try:
+        for each_batch in result.partitions():
+            yield each_batch
+    finally:
+        result.close()
+
+
+def csv_chunks(start_date=None, end_date=None, batch_size=10000):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow([name for name, column in EXPORT_COLUMNS])
+
+    for each_batch in row_batches(start_date, end_date, batch_size):
+        writer.writerows(each_batch)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+class _ChunkSink:
+    # Minimal writable file handed to the Parquet writer; the written bytes are collected and
+    # drained after every row group so they can be streamed out
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def parquet_schema(pa):
+    return pa.schema([
+        ('order_id', pa.int64()), ('order_date', pa.timestamp('us')), ('customer_id', pa.int64()),
+        ('state', pa.string()), ('status', pa.string()), ('order_item_id', pa.int64()),
+        ('product_id', pa.int64()), ('product_code', pa.string()), ('product_name', pa.string()),
+        ('quantity', pa.int64()), ('price_charged', pa.float64()),
+    ])
+
+
+def parquet_chunks(start_date=None, end_date=None, batch_size=10000):
+    # Each batch of rows becomes one Arrow record batch and one Parquet row group
+    if not parquet_available():
+        raise RuntimeError('Parquet exports require pyarrow to be installed.')
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema(pa)
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='snappy')
+
+    for each_batch in row_batches(start_date, end_date, batch_size):
+        columns = list(zip(*each_batch))
+        writer.write_batch(pa.RecordBatch.from_arrays(
+            [pa.array(each_column, type=each_field.type) for each_column, each_field in zip(columns, schema)],
+            schema=schema))
+        yield sink.drain()
+
+    writer.close()
+    yield sink.drain()
+
+
+def export_chunks(export_format, start_date=None, end_date=None, batch_size=10000):
+    if export_format == 'parquet':
+        return parquet_chunks(start_date, end_date, batch_size)
+    return csv_chunks(start_date, end_date, batch_size)
+
+
+def export_filename(export_format, start_date=None, end_date=None):
+    date_range = '-'.join(each_date.isoformat() for each_date in (start_date, end_date) if each_date)
+    return f'orders{"-" + date_range if date_range else ""}.{EXPORT_FORMATS[export_format][1]}'
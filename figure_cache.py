@@ -0,0 +1,58 @@
+import hashlib
+import threading
+import time
+
+
+class FigureCache:
+    # Per chart cache of serialized figure JSON. Each entry remembers the versions of the
+    # data it was built from (e.g. 'products', 'orders') so a change only rebuilds the
+    # charts that depend on it. shared_versions returns versions kept in the database (e.g. the
+    # catalog version), which also change for writes made by other workers and CLI commands; the
+    # TTL bounds staleness for the remaining changes made elsewhere.
+
+    def __init__(self, ttl=300, shared_versions=None):
+        self.ttl = ttl
+        self.shared_versions = shared_versions
+        self._entries = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def _current_versions(self, depends_on, shared_versions):
+        return tuple((self._versions.get(each_dependency, 0), shared_versions.get(each_dependency))
+                     for each_dependency in depends_on)
+
+    def get(self, name, depends_on, builder, variant=None):
+        # variant is whatever else the figure was built for (e.g. a start date); an entry built for
+        # another variant is replaced rather than kept alongside it
+        shared_versions = self.shared_versions() if self.shared_versions else {}
+        with self._lock:
+            entry = self._entries.get(name)
+            versions = self._current_versions(depends_on, shared_versions)
+
+            if entry and entry['versions'] == versions and entry['variant'] == variant \
+                    and time.monotonic() - entry['built_at'] < self.ttl:
+                return entry['payload'], entry['etag']
+
+        # Build outside of the lock so a slow figure does not block other charts
+        payload = builder()
+        etag = hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+        with self._lock:
+            self._entries[name] = {'payload': payload, 'etag': etag, 'versions': versions, 'variant': variant,
+                                   'built_at': time.monotonic()}
+
+        return payload, etag
+
+    def invalidate(self, *dependencies):
+        with self._lock:
+            for each_dependency in dependencies:
+                self._versions[each_dependency] = self._versions.get(each_dependency, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def combine_etags(*etags):
+    # A page made of several cached payloads is unchanged only if every payload is unchanged
+    return hashlib.sha1('-'.join(etags).encode('utf-8')).hexdigest()
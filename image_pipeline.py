@@ -0,0 +1,118 @@
+import hashlib
+import logging
+import os
+import re
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow is optional; without it only the original upload is served
+    Image = None
+
+
+# Product image handling: uploads are streamed to disk, and the resized variants used by the
+# storefront (a small grid thumbnail and a larger detail image, each also as WebP) are made by
+# a background worker pool so the admin request does not wait for them.
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+logger = logging.getLogger(__name__)
+
+# Uploads are stored as <prefix>-<first 16 hex digits of their SHA-256><extension>, so a
+# replaced image always gets a new URL and any stored URL can be cached forever
+CONTENT_HASH_LENGTH = 16
+CONTENT_HASHED_NAME = re.compile(r'-[0-9a-f]{%d}(\.[a-z]+)?\.[a-z0-9]+$' % CONTENT_HASH_LENGTH)
+
+
+def is_content_hashed(filename):
+    return CONTENT_HASHED_NAME.search(filename) is not None
+
+
+def variant_filename(filename, variant, extension=None):
+    stem, original_extension = os.path.splitext(filename)
+    return f'{stem}.{variant}{extension or original_extension}'
+
+
+class ImagePipeline:
+
+    def __init__(self, directory, variants, max_workers=2, on_complete=None):
+        self.directory = directory
+        self.variants = variants  # variant name -> longest side in pixels
+        self.on_complete = on_complete
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='image-pipeline')
+
+    def path(self, filename):
+        return os.path.join(self.directory, filename)
+
+    def save_upload(self, file_storage, prefix, extension):
+        # Copy the upload to disk in chunks, hashing it on the way, then move it into place under
+        # its content hashed name. Returns the stored filename.
+        os.makedirs(self.directory, exist_ok=True)
+        digest = hashlib.sha256()
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.upload')
+        with os.fdopen(file_descriptor, 'wb') as destination:
+            for chunk in iter(lambda: file_storage.stream.read(UPLOAD_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                destination.write(chunk)
+
+        filename = f'{prefix}-{digest.hexdigest()[:CONTENT_HASH_LENGTH]}{extension.lower()}'
+        os.replace(temp_path, self.path(filename))
+        return filename
+
+    def submit(self, filename):
+        if Image is None:
+            return None
+        future = self._executor.submit(self._make_variants, filename)
+        future.add_done_callback(lambda done: self._log_failure(filename, done))
+        return future
+
+    def _log_failure(self, filename, future):
+        # Nobody waits on the future, so a failed resize would otherwise go unnoticed; the
+        # storefront keeps serving the original upload for it
+        error = future.exception()
+        if error is not None:
+            logger.error('Could not make image variants of %s', filename, exc_info=error)
+
+    def _make_variants(self, filename):
+        with Image.open(self.path(filename)) as original:
+            original.load()
+            for each_variant, max_side in self.variants.items():
+                resized = original.copy()
+                resized.thumbnail((max_side, max_side))
+                self._save(resized, variant_filename(filename, each_variant))
+                self._save(resized, variant_filename(filename, each_variant, '.webp'))
+
+        if self.on_complete:
+            self.on_complete(filename)
+
+    def _save(self, image, filename):
+        if filename.lower().endswith(('.jpg', '.jpeg')) and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+
+        # Write under a temporary name so the storefront never links to a half written file
+        temp_path = self.path(filename + '.tmp')
+        image.save(temp_path, format=Image.registered_extensions().get(os.path.splitext(filename)[1].lower()))
+        os.replace(temp_path, self.path(filename))
+
+    def remove(self, filename):
+        # Delete an image together with all of its variants
+        if not filename:
+            return
+
+        names = [filename]
+        for each_variant in self.variants:
+            names += [variant_filename(filename, each_variant), variant_filename(filename, each_variant, '.webp')]
+
+        for each_name in names:
+            try:
+                os.remove(self.path(each_name))
+            except OSError:
+                pass  # Nothing to do as file is no longer being stored
+
+    def variant(self, filename, variant, extension=None):
+        # Name of a ready variant of the image, or None while it is missing or still being made
+        name = variant_filename(filename, variant, extension)
+        if os.path.exists(self.path(name)):
+            return name
+        return None
@@ -0,0 +1,106 @@
+from sqlalchemy import inspect, func, select
+from sqlalchemy.schema import CreateTable
+from models import db, OrderDailyRollup, ProductDailySales
+import archive
+import rollups
+
+
+# Brings an existing database up to the schema declared in models.py. create_all() only adds
+# missing tables (and the indexes of tables it creates), so indexes added to existing tables
+# are created here explicitly, and SQLite tables declared with sqlite_autoincrement after they
+# were created are rebuilt. Indexes no longer declared there are listed in OBSOLETE_INDEXES and
+# dropped.
+
+# The catalog pages are cut from the in-memory snapshot (catalog_snapshot.py) instead of keyset queries
+OBSOLETE_INDEXES = ['ix_product_name_id', 'ix_product_category_name_id']
+
+def missing_indexes():
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+
+    for each_table in db.metadata.sorted_tables:
+        if each_table.name not in existing_tables:
+            continue
+        existing_indexes = {each_index['name'] for each_index in inspector.get_indexes(each_table.name)}
+        for each_index in each_table.indexes:
+            if each_index.name not in existing_indexes:
+                yield each_index
+
+
+def tables_missing_autoincrement(connection):
+    # SQLite can only add AUTOINCREMENT by creating the table again
+    for each_table in db.metadata.sorted_tables:
+        if not each_table.dialect_options['sqlite']['autoincrement']:
+            continue
+        create_sql = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (each_table.name,)).scalar()
+        if create_sql and 'AUTOINCREMENT' not in create_sql.upper():
+            yield each_table
+
+
+def rebuild_with_autoincrement(connection, table):
+    # Copies the table into a new one declared with AUTOINCREMENT, swaps them and recreates the
+    # indexes, returning how many. The id sequence starts past every id used so far, archived
+    # ones included.
+    new_name = f'{table.name}_autoincrement'
+    create_sql = str(CreateTable(table).compile(dialect=connection.dialect))
+    column_names = ', '.join(each_column.name for each_column in table.columns)
+
+    connection.exec_driver_sql(create_sql.replace(f'CREATE TABLE {table.name} ', f'CREATE TABLE {new_name} ', 1))
+    connection.exec_driver_sql(f'INSERT INTO {new_name} ({column_names}) SELECT {column_names} FROM {table.name}')
+    connection.exec_driver_sql(f'DROP TABLE {table.name}')
+    connection.exec_driver_sql(f'ALTER TABLE {new_name} RENAME TO {table.name}')
+    for each_index in table.indexes:
+        each_index.create(connection)
+
+    id_column = table.primary_key.columns[0]
+    used_ids = [connection.execute(select(func.max(id_column))).scalar() or 0]
+    for each_name in archive.archive_table_names(connection):
+        if each_name.startswith(f'{table.name}_archive_'):
+            used_ids.append(connection.exec_driver_sql(f'SELECT max({id_column.name}) FROM {each_name}').scalar() or 0)
+    connection.exec_driver_sql('DELETE FROM sqlite_sequence WHERE name = ?', (table.name,))
+    connection.exec_driver_sql('INSERT INTO sqlite_sequence (name, seq) VALUES (?, ?)', (table.name, max(used_ids)))
+    return len(table.indexes)
+
+
+def upgrade_database(log=print):
+    existing_tables = set(inspect(db.engine).get_table_names())
+    db.create_all()
+
+    # Derived tables added after the database was created are filled from their source
+    missing_rollups = {OrderDailyRollup.__tablename__, ProductDailySales.__tablename__} - existing_tables
+    if missing_rollups:
+        log(f'Building {", ".join(sorted(missing_rollups))} from store_order and order_item')
+        rollups.rebuild_rollups()
+
+    created = 0
+    if db.engine.dialect.name == 'sqlite':
+        with db.engine.connect() as connection:
+            # Other tables' foreign keys point at the tables being swapped; the pragma only works outside a transaction
+            foreign_keys = connection.exec_driver_sql('PRAGMA foreign_keys').scalar()
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+            connection.commit()
+            try:
+                with connection.begin():
+                    for each_table in list(tables_missing_autoincrement(connection)):
+                        log(f'Rebuilding {each_table.name} with AUTOINCREMENT ids')
+                        created += rebuild_with_autoincrement(connection, each_table)
+            finally:
+                connection.exec_driver_sql(f'PRAGMA foreign_keys={foreign_keys}')
+                connection.commit()
+
+    with db.engine.begin() as connection:
+        for each_name in OBSOLETE_INDEXES:
+            connection.exec_driver_sql(f'DROP INDEX IF EXISTS {each_name}')
+
+    for each_index in missing_indexes():
+        log(f'Creating index {each_index.name} on {each_index.table.name}')
+        each_index.create(db.engine)
+        created += 1
+
+    # Refresh the planner statistics so the new indexes are actually chosen
+    if created and db.engine.dialect.name == 'sqlite':
+        with db.engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+
+    return created
@@ -5,6 +5,13 @@ db = SQLAlchemy()
 
 class Product(db.Model):
     __tablename__ = 'product'
+    __table_args__ = (
+        # Dashboard product counts per category
+        db.Index('ix_product_category_id', 'category_id'),
+        # Bulk imports match rows to existing products by code (see catalog_import.py)
+        db.Index('ix_product_code', 'product_code'),
+    )
+
     product_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     category_id = db.Column(db.Integer, db.ForeignKey('product_category.category_id'))
     product_name = db.Column(db.String(100), nullable=False)
@@ -41,9 +48,11 @@ class ProductCategory(db.Model):
 
 class StoreOrder(db.Model):
     __tablename__ = 'store_order'
+    # AUTOINCREMENT, so ids of archived orders (see archive.py) are never handed out again
+    __table_args__ = {'sqlite_autoincrement': True}
 
     order_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    order_date = db.Column(db.DateTime, nullable=False)
+    order_date = db.Column(db.DateTime, nullable=False, index=True)
     customer_id = db.Column(db.Integer, db.ForeignKey('customer.customer_id'))
     first_name = db.Column(db.String(30), nullable=False)
     last_name = db.Column(db.String(50), nullable=False)
@@ -51,13 +60,13 @@ class StoreOrder(db.Model):
     email = db.Column(db.String(100))
     address = db.Column(db.String(100))
     city = db.Column(db.String(100))
-    state = db.Column(db.String(2))
+    state = db.Column(db.String(2), index=True)
     zip = db.Column(db.String(9))
     status = db.Column(db.String(20), default='PENDING PAYMENT')
     payment_type = db.Column(db.String(10))
     customers = db.relationship('Customer', backref='customers')
 
-    def __init__(self, customer_id, first_name, last_name, phone_number, email, address, city, state, zip, order_date=dt.now()):
+    def __init__(self, customer_id, first_name, last_name, phone_number, email, address, city, state, zip, order_date=None):
         self.customer_id = customer_id
         self.first_name = first_name
         self.last_name = last_name
@@ -67,24 +76,30 @@ class StoreOrder(db.Model):
         self.city = city
         self.state = state
         self.zip = zip
-        self.order_date = order_date
+        # Read the clock per order; a dt.now() default argument is evaluated only once, at import
+        self.order_date = order_date or dt.now()
 
 class OrderItem(db.Model):
     __tablename__ = 'order_item'
+    # AUTOINCREMENT, like store_order
+    __table_args__ = {'sqlite_autoincrement': True}
 
     order_item_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('store_order.order_id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('store_order.order_id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('product.product_id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price_charged = db.Column(db.Float, nullable=False)
 
-    def __init__(self, order_id, product_id, quantity):
-        product = Product.query.filter_by(product_id=product_id).first()
+    def __init__(self, order_id, product_id, quantity, price_charged=None):
+        # Callers pricing many items at once should pass price_charged (see orders.price_order_items)
+        if price_charged is None:
+            product = Product.query.filter_by(product_id=product_id).first()
+            price_charged = product.product_price * quantity
 
         self.order_id = order_id
         self.product_id = product_id
         self.quantity = quantity
-        self.price_charged = product.product_price * quantity
+        self.price_charged = price_charged
 
 
 class Customer(db.Model):
@@ -125,4 +140,156 @@ class User(UserMixin, db.Model):
         return(self.user_id)
 
     def __repr__(self):
-        return f"{self.first_name} {self.last_name} ({self.username})"
\ No newline at end of file
+        return f"{self.first_name} {self.last_name} ({self.username})"
+
+class OrderDailyRollup(db.Model):
+    __tablename__ = 'order_daily_rollup'
+    __table_args__ = (
+        # Covers the per-state totals without reading the table
+        db.Index('ix_order_daily_rollup_state_count', 'state', 'order_count'),
+    )
+
+    # One row per day and state, maintained by rollups.py as orders are written
+    rollup_date = db.Column(db.Date, primary_key=True)
+    state = db.Column(db.String(2), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, rollup_date, state, order_count=0):
+        self.rollup_date = rollup_date
+        self.state = state
+        self.order_count = order_count
+
+    def __repr__(self):
+        return f"{self.rollup_date} {self.state}: {self.order_count}"
+
+
+class Cart(db.Model):
+    __tablename__ = 'cart'
+
+    # Server-side shopping cart; the session cookie only carries the cart_id
+    cart_id = db.Column(db.String(32), primary_key=True)
+    cart_total = db.Column(db.Float, nullable=False, default=0)
+    # Abandoned carts are purged by updated_at (see 'flask purge-carts')
+    updated_at = db.Column(db.DateTime, nullable=False, default=dt.now, onupdate=dt.now, index=True)
+
+    def __init__(self, cart_id, cart_total=0):
+        self.cart_id = cart_id
+        self.cart_total = cart_total
+
+
+class CartItem(db.Model):
+    __tablename__ = 'cart_item'
+
+    cart_id = db.Column(db.String(32), db.ForeignKey('cart.cart_id'), primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    product_name = db.Column(db.String(100), nullable=False)
+    product_image = db.Column(db.String(100))
+    product_price = db.Column(db.Float, nullable=False)
+    product_quantity = db.Column(db.Integer, nullable=False)
+    added_at = db.Column(db.DateTime, nullable=False, default=dt.now)
+
+    def __init__(self, cart_id, product_id, product_name, product_image, product_price, product_quantity):
+        self.cart_id = cart_id
+        self.product_id = product_id
+        self.product_name = product_name
+        self.product_image = product_image
+        self.product_price = product_price
+        self.product_quantity = product_quantity
+
+    def to_dict(self):
+        return {'product_id': self.product_id, 'product_name': self.product_name,
+                'product_image': self.product_image, 'product_quantity': self.product_quantity,
+                'product_price': self.product_price}
+
+
+class ProductDailySales(db.Model):
+    __tablename__ = 'product_daily_sales'
+
+    # One row per day and product, maintained by rollups.py as orders are written; backs the revenue panels
+    sales_date = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_lines = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, sales_date, product_id, quantity=0, revenue=0, order_lines=0):
+        self.sales_date = sales_date
+        self.product_id = product_id
+        self.quantity = quantity
+        self.revenue = revenue
+        self.order_lines = order_lines
+
+    def __repr__(self):
+        return f"{self.sales_date} {self.product_id}: {self.revenue}"
+
+
+class CatalogVersion(db.Model):
+    __tablename__ = 'catalog_version'
+
+    # Single row counter bumped in the same transaction as any product or category change, so
+    # every worker can tell when its in-memory catalog snapshot is out of date (see catalog_snapshot.py)
+    catalog_version_id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, catalog_version_id=1, version=0):
+        self.catalog_version_id = catalog_version_id
+        self.version = version
+
+    def __repr__(self):
+        return f"Catalog version {self.version}"
+
+
+class OrderArchiveRollup(db.Model):
+    __tablename__ = 'order_archive_rollup'
+
+    # Daily per-state counts of the orders moved out of store_order by archive.py; rebuilding
+    # the rollups adds these to the counts of the orders still in store_order
+    rollup_date = db.Column(db.Date, primary_key=True)
+    state = db.Column(db.String(2), primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, rollup_date, state, order_count=0):
+        self.rollup_date = rollup_date
+        self.state = state
+        self.order_count = order_count
+
+    def __repr__(self):
+        return f"{self.rollup_date} {self.state}: {self.order_count} archived"
+
+
+class ProductArchiveSales(db.Model):
+    __tablename__ = 'product_archive_sales'
+
+    # Daily per-product sales of archived orders, the archive counterpart of product_daily_sales
+    sales_date = db.Column(db.Date, primary_key=True)
+    product_id = db.Column(db.Integer, primary_key=True)
+    quantity = db.Column(db.Integer, nullable=False, default=0)
+    revenue = db.Column(db.Float, nullable=False, default=0)
+    order_lines = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, sales_date, product_id, quantity=0, revenue=0, order_lines=0):
+        self.sales_date = sales_date
+        self.product_id = product_id
+        self.quantity = quantity
+        self.revenue = revenue
+        self.order_lines = order_lines
+
+    def __repr__(self):
+        return f"{self.sales_date} {self.product_id}: {self.revenue} archived"
+
+
+class OrderArchiveHourly(db.Model):
+    __tablename__ = 'order_archive_hourly'
+
+    # Archived order counts by weekday (0 = Sunday) and hour, for the dashboard's weekday/hour chart
+    weekday = db.Column(db.Integer, primary_key=True)
+    hour = db.Column(db.Integer, primary_key=True)
+    order_count = db.Column(db.Integer, nullable=False, default=0)
+
+    def __init__(self, weekday, hour, order_count=0):
+        self.weekday = weekday
+        self.hour = hour
+        self.order_count = order_count
+
+    def __repr__(self):
+        return f"{self.weekday} {self.hour}: {self.order_count} archived"
\ No newline at end of file
@@ -0,0 +1,90 @@
+import queue
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from models import db
+import orders
+
+
+# Write-behind checkout for SQLite. Requests price and validate their order, put it on a
+# queue and wait for its id; a single writer thread drains the queue and commits every order
+# waiting at that moment in one transaction. Checkouts then share one write lock acquisition
+# and one commit per batch instead of each taking the lock in turn. If a batch fails, its
+# orders are retried one transaction each so a bad order only fails its own request.
+
+_STOP = object()
+
+
+class OrderWriter:
+
+    def __init__(self, app, max_batch=100, timeout=30):
+        self.app = app
+        self.max_batch = max_batch
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='order-writer', daemon=True)
+        self._thread.start()
+
+    def place_order(self, customer_id, shipping, cart_items, snapshot=None):
+        # Same contract as orders.place_order: returns the order id or raises orders.OrderError
+        order_item_rows = orders.price_order_items(None, cart_items, snapshot=snapshot)
+        # Pricing may have read from the request's session; release its read transaction before waiting
+        db.session.rollback()
+
+        future = Future()
+        self._queue.put((customer_id, shipping, order_item_rows, future))
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            # Still queued: the writer will commit it later
+            raise orders.OrderPending('Your order was received and is still being processed. '
+                                      'Please do not place it again.')
+        except orders.OrderError:
+            raise
+        except Exception as e:
+            # The writer rolled the order back, so placing it again is safe
+            raise orders.OrderError('It could not be saved, please try again.') from e
+
+    def close(self):
+        self._queue.put(_STOP)
+        self._thread.join()
+
+    def _next_batch(self):
+        # Blocks for the first order, then takes whatever else is already queued
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch and batch[-1] is not _STOP:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            stopping = batch[-1] is _STOP
+            if stopping:
+                batch.pop()
+
+            if batch:
+                with self.app.app_context():
+                    self._write_batch(batch)
+
+            if stopping:
+                return
+
+    def _write_batch(self, batch):
+        try:
+            order_ids = orders.write_orders([(customer_id, shipping, order_item_rows)
+                                             for customer_id, shipping, order_item_rows, _ in batch])
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            if len(batch) > 1:
+                for each_order in batch:
+                    self._write_batch([each_order])
+            else:
+                batch[0][3].set_exception(e)
+            return
+
+        for (_, _, _, future), order_id in zip(batch, order_ids):
+            future.set_result(order_id)
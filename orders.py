@@ -0,0 +1,87 @@
+from sqlalchemy import insert
+from models import db, Product, StoreOrder, OrderItem
+import rollups
+
+
+class OrderError(ValueError):
+    pass
+
+
+class OrderPending(OrderError):
+    # The order was queued but not confirmed in time; it may still be committed, so it must not be placed again
+    pass
+
+
+def price_order_items(order_id, cart_items, session=None, snapshot=None):
+    # Price every cart line from the catalog snapshot when given, otherwise from a single IN (...)
+    # query instead of one query per line
+    session = session or db.session
+    if not cart_items:
+        raise OrderError('Your cart is empty')
+
+    product_ids = {each_item['product_id'] for each_item in cart_items}
+    if snapshot is not None:
+        prices = {product_id: snapshot.products[product_id].product_price
+                  for product_id in product_ids if product_id in snapshot.products}
+    else:
+        prices = dict(
+            session.query(Product.product_id, Product.product_price)
+            .filter(Product.product_id.in_(product_ids))
+            .all()
+        ) if product_ids else {}
+
+    missing_product_ids = product_ids - prices.keys()
+    if missing_product_ids:
+        raise OrderError(f'Products no longer available: {sorted(missing_product_ids)}')
+
+    return [{'order_id': order_id, 'product_id': each_item['product_id'],
+             'quantity': each_item['product_quantity'],
+             'price_charged': prices[each_item['product_id']] * each_item['product_quantity']}
+            for each_item in cart_items]
+
+
+def write_orders(pending_orders, session=None):
+    # Adds orders given as (customer_id, shipping, priced order item rows) along with their items
+    # and the dashboard rollups to the current transaction and returns their ids in the same
+    # order; committing is left to the caller. The orders go out in a single flush and all of
+    # their items in one executemany, however many orders there are.
+    session = session or db.session
+
+    store_orders = [StoreOrder(customer_id=customer_id, **shipping) for customer_id, shipping, _ in pending_orders]
+    session.add_all(store_orders)
+    session.flush()
+
+    # One product sales upsert per day in the batch, not one per order timestamp
+    order_item_rows_by_date = {}
+    for each_order, (_, _, order_item_rows) in zip(store_orders, pending_orders):
+        order_item_rows_by_date.setdefault(rollups._rollup_date(each_order.order_date), []).extend(
+            dict(each_row, order_id=each_order.order_id) for each_row in order_item_rows)
+
+    all_order_item_rows = [each_row for each_date_rows in order_item_rows_by_date.values() for each_row in each_date_rows]
+    if all_order_item_rows:
+        session.execute(insert(OrderItem), all_order_item_rows)
+
+    rollups.record_orders(store_orders, session=session)
+    for order_date, order_item_rows in order_item_rows_by_date.items():
+        rollups.record_order_items(order_date, order_item_rows, session=session)
+
+    return [each_order.order_id for each_order in store_orders]
+
+
+def write_order(customer_id, shipping, order_item_rows, session=None):
+    return write_orders([(customer_id, shipping, order_item_rows)], session=session)[0]
+
+
+def place_order(customer_id, shipping, cart_items, session=None, snapshot=None):
+    # Writes the order, its items and the dashboard rollup in one transaction and returns the order id
+    session = session or db.session
+
+    try:
+        order_item_rows = price_order_items(None, cart_items, session=session, snapshot=snapshot)
+        order_id = write_order(customer_id, shipping, order_item_rows, session=session)
+        session.commit()
+    except Exception:
+        session.rollback()
+        raise
+
+    return order_id
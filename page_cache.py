@@ -0,0 +1,196 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import urllib.parse
+from collections import OrderedDict
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+
+logger = logging.getLogger(__name__)
+
+
+# Rendered page and fragment cache for the storefront. Every entry is stored with the
+# catalog version it was rendered from, read through version_source (the shared
+# catalog_version row, see catalog_snapshot.py). Any product or category change, in any
+# worker or CLI command, bumps that version and makes all existing entries unreachable at
+# once instead of tracking which pages showed what. Renders pass the version they started
+# from to set(), so a page rendered before a bump is never stored under the new version.
+
+class MemoryPageCache:
+    # Bounded, per-process LRU cache
+
+    def __init__(self, version_source, max_entries=512):
+        self.version_source = version_source
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def version(self):
+        return self.version_source()
+
+    def get(self, key):
+        version = self.version()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == version:
+                self._entries.move_to_end(key)
+                return entry[1]
+            return None
+
+    def set(self, key, value, version=None):
+        current_version = self.version()
+        if version is not None and version != current_version:
+            return
+        with self._lock:
+            # Entries from older versions are replaced here or age out of the LRU
+            self._entries[key] = (current_version, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+class FileSystemPageCache:
+    # Cache entries kept as JSON files, shared by every worker on the host. At most
+    # max_entries files are kept; the least recently written ones are removed first.
+
+    def __init__(self, version_source, directory, max_entries=512):
+        self.version_source = version_source
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def version(self):
+        return self.version_source()
+
+    def _path(self, version, key):
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f'{version}-{digest}.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(self.version(), key), encoding='utf-8') as entry_file:
+                return json.load(entry_file)
+        except (OSError, ValueError):
+            return None
+
+    def set(self, key, value, version=None):
+        current_version = self.version()
+        if version is not None and version != current_version:
+            return
+
+        # Write to a temporary file first so readers never see a partial entry
+        file_descriptor, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(file_descriptor, 'w', encoding='utf-8') as entry_file:
+            json.dump(value, entry_file)
+        os.replace(temp_path, self._path(current_version, key))
+        self._prune(current_version)
+
+    def _prune(self, version):
+        # Entries from older versions can no longer be reached, so clean them up, then trim to max_entries
+        entries = []
+        for each_file in os.listdir(self.directory):
+            if not each_file.endswith('.json'):
+                continue
+            path = os.path.join(self.directory, each_file)
+            try:
+                if each_file.startswith(f'{version}-'):
+                    entries.append((os.path.getmtime(path), path))
+                else:
+                    os.remove(path)
+            except OSError:
+                pass
+
+        entries.sort()
+        for _, path in entries[:max(0, len(entries) - self.max_entries)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+class NullPageCache:
+    # Disables caching while keeping the same interface
+
+    def version(self):
+        return 0
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, version=None):
+        pass
+
+
+def writable_directory(directory):
+    # Creates the directory if needed; False when it cannot be written to (e.g. a read-only deployment)
+    try:
+        os.makedirs(directory, exist_ok=True)
+    except OSError:
+        return False
+    return os.access(directory, os.W_OK)
+
+
+def create_page_cache(backend, version_source, max_entries=512, directory=None):
+    if backend == 'filesystem' and not writable_directory(directory):
+        logger.warning('Page cache directory %s is not writable; caching pages in memory instead', directory)
+        backend = 'memory'
+
+    if backend == 'memory':
+        return MemoryPageCache(version_source, max_entries=max_entries)
+    elif backend == 'filesystem':
+        return FileSystemPageCache(version_source, directory, max_entries=max_entries)
+    elif backend == 'none':
+        return NullPageCache()
+    raise ValueError(f'Unknown page cache backend: {backend}')
+
+
+def cache_key(prefix, query_args=()):
+    # Only the query string arguments a page reads are part of its key, so made up arguments
+    # (/?x=1, /?x=2, ...) all share one entry instead of each adding their own
+    values = [(each_name, request.args.get(each_name)) for each_name in query_args]
+    return prefix + '?' + urllib.parse.urlencode([(name, value) for name, value in values if value is not None])
+
+
+def cached_fragment(page_cache, key, render):
+    fragment = page_cache.get(key)
+    if fragment is None:
+        version = page_cache.version()
+        fragment = render()
+        if fragment is not None:
+            page_cache.set(key, fragment, version=version)
+    return fragment
+
+
+def conditional_page(response):
+    # A content ETag lets browsers revalidate cached pages (and marks them as worth
+    # compressing once, see compression.py)
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+def cache_anonymous_page(page_cache, query_args=()):
+    # Serves whole pages from the cache for anonymous GET requests. Logged in users (whose
+    # navbar differs) and requests with pending flash messages are always rendered.
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET' or current_user.is_authenticated or session.get('_flashes'):
+                return func(*args, **kwargs)
+
+            key = cache_key('page:' + request.path, query_args)
+            body = page_cache.get(key)
+            if body is not None:
+                return conditional_page(make_response(body))
+
+            version = page_cache.version()
+            response = make_response(func(*args, **kwargs))
+            if response.status_code == 200 and not session.get('_flashes'):
+                page_cache.set(key, response.get_data(as_text=True), version=version)
+                return conditional_page(response)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,159 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from flask import g, request, has_request_context, request_started, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+
+# Per-request instrumentation: SQL query count and time (SQLAlchemy engine events), template
+# render time (Flask template signals), time spent in other tracked sections such as Plotly
+# serialization, and total latency. Each request reports its numbers in a Server-Timing
+# header and they are aggregated into per-endpoint histograms for the /metrics endpoint.
+
+# Histogram bucket upper bounds in milliseconds (and plain counts for queries)
+LATENCY_BUCKETS_MS = [1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+QUERY_COUNT_BUCKETS = [0, 1, 2, 5, 10, 20, 50, 100, 250]
+
+
+class Histogram:
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # the last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def cumulative(self):
+        running = 0
+        for each_bound, each_count in zip(self.buckets + ['+Inf'], self.counts):
+            running += each_count
+            yield each_bound, running
+
+
+class RequestProfiler:
+    # Flask extension; enable with RequestProfiler(app) or profiler.init_app(app)
+
+    METRICS = {
+        'request_duration_ms': LATENCY_BUCKETS_MS,
+        'db_duration_ms': LATENCY_BUCKETS_MS,
+        'render_duration_ms': LATENCY_BUCKETS_MS,
+        'db_queries': QUERY_COUNT_BUCKETS,
+    }
+
+    def __init__(self, app=None):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['request_profiler'] = self
+
+        event.listen(Engine, 'before_cursor_execute', self._before_cursor_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_cursor_execute)
+        request_started.connect(self._request_started, app)
+        before_render_template.connect(self._before_render_template, app)
+        template_rendered.connect(self._template_rendered, app)
+        app.after_request(self._after_request)
+
+    ### Request lifecycle ###
+    def _request_started(self, sender, **extra):
+        g.profile = {'started': time.perf_counter(), 'queries': 0, 'db': 0.0, 'render': 0.0,
+                     'render_depth': 0, 'render_started': 0.0, 'sections': {}}
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'profile' in g:
+            conn.info.setdefault('profile_query_started', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('profile_query_started')
+        if started and has_request_context() and 'profile' in g:
+            g.profile['db'] += time.perf_counter() - started.pop()
+            g.profile['queries'] += 1
+
+    def _before_render_template(self, sender, template, context, **extra):
+        # Templates can render other templates (cached fragments), so only time the outermost one
+        if 'profile' in g:
+            if g.profile['render_depth'] == 0:
+                g.profile['render_started'] = time.perf_counter()
+            g.profile['render_depth'] += 1
+
+    def _template_rendered(self, sender, template, context, **extra):
+        if 'profile' in g and g.profile['render_depth'] > 0:
+            g.profile['render_depth'] -= 1
+            if g.profile['render_depth'] == 0:
+                g.profile['render'] += time.perf_counter() - g.profile['render_started']
+
+    def _after_request(self, response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+
+        timings = {
+            'db': profile['db'] * 1000,
+            'render': profile['render'] * 1000,
+            **{each_section: seconds * 1000 for each_section, seconds in profile['sections'].items()},
+            'total': (time.perf_counter() - profile['started']) * 1000,
+        }
+
+        server_timing = [f'{each_name};dur={duration:.2f}' for each_name, duration in timings.items()]
+        server_timing[0] += f';desc="{profile["queries"]} queries"'
+        response.headers.add('Server-Timing', ', '.join(server_timing))
+
+        self.observe(request.endpoint or 'unknown', {
+            'request_duration_ms': timings['total'],
+            'db_duration_ms': timings['db'],
+            'render_duration_ms': timings['render'],
+            'db_queries': profile['queries'],
+            **{f'{each_section}_duration_ms': profile['sections'][each_section] * 1000
+               for each_section in profile['sections']},
+        })
+        return response
+
+    ### Aggregation ###
+    def observe(self, endpoint, values):
+        with self._lock:
+            for each_metric, value in values.items():
+                key = (each_metric, endpoint)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram(self.METRICS.get(each_metric, LATENCY_BUCKETS_MS))
+                self._histograms[key].observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+
+    def render_metrics(self):
+        # Prometheus text exposition format
+        lines = []
+        with self._lock:
+            for each_metric in sorted({each_key[0] for each_key in self._histograms}):
+                name = f'terpstore_{each_metric}'
+                lines.append(f'# TYPE {name} histogram')
+                for (metric, endpoint), histogram in sorted(self._histograms.items()):
+                    if metric != each_metric:
+                        continue
+                    for bound, count in histogram.cumulative():
+                        lines.append(f'{name}_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+                    lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {histogram.total:.3f}')
+                    lines.append(f'{name}_count{{endpoint="{endpoint}"}} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+
+@contextmanager
+def track(section):
+    # Times a block of work (e.g. Plotly serialization) as its own Server-Timing entry
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if has_request_context() and 'profile' in g:
+            sections = g.profile['sections']
+            sections[section] = sections.get(section, 0.0) + time.perf_counter() - started
@@ -0,0 +1,102 @@
+import datetime as dt
+import re
+from sqlalchemy import select, func, inspect
+from models import db, Product, ProductCategory, StoreOrder, OrderItem, Customer, OrderDailyRollup
+import rollups
+
+
+# EXPLAIN QUERY PLAN checks (SQLite) for the dashboard and checkout queries. A query fails
+# the check when SQLite plans a plain "SCAN <table>", i.e. reads the table without an index.
+# Tables listed in allow_scan are small by design (the rollups grow with days x states, and the
+# sales aggregate with days x products sold). Once ANALYZE has run, SQLite rightly scans tables
+# holding only a handful of rows even when an index fits, so a table with fewer than
+# SMALL_TABLE_ROWS rows may be scanned too; on such a database the check cannot tell whether
+# an index is missing for it.
+
+FULL_SCAN = re.compile(r'^SCAN (\w+)$')
+
+SMALL_TABLE_ROWS = 1000
+
+
+def checked_queries():
+    since = dt.datetime.now() - dt.timedelta(days=30)
+
+    return [
+        ('dashboard: products per category',
+         select(ProductCategory.category_name, func.count(Product.category_id))
+         .join(ProductCategory, Product.category_id == ProductCategory.category_id)
+         .group_by(Product.category_id).order_by(ProductCategory.category_name), {'product_category'}),
+        ('dashboard: orders in past 30 days (rollup)',
+         select(func.sum(OrderDailyRollup.order_count)).where(OrderDailyRollup.rollup_date >= since.date()), set()),
+        ('dashboard: orders by state (rollup)',
+         select(OrderDailyRollup.state, func.sum(OrderDailyRollup.order_count))
+         .group_by(OrderDailyRollup.state).order_by(OrderDailyRollup.state), set()),
+        ('dashboard: orders by month (rollup)',
+         select(rollups.month_of(OrderDailyRollup.rollup_date), func.sum(OrderDailyRollup.order_count))
+         .group_by(rollups.month_of(OrderDailyRollup.rollup_date)), {'order_daily_rollup'}),
+        ('dashboard: revenue by month since a date (sales aggregate)',
+         rollups.revenue_by_month(since.date()).statement, set()),
+        ('dashboard: revenue by month, all time (sales aggregate)',
+         rollups.revenue_by_month().statement, {'product_daily_sales'}),
+        ('dashboard: top products since a date (sales aggregate)',
+         rollups.top_products(10, since.date()).statement, {'anon_1'}),
+        ('dashboard: revenue by category since a date (sales aggregate)',
+         rollups.revenue_by_category(since.date()).statement, set()),
+        ('store_order: orders in past 30 days',
+         select(func.count(StoreOrder.order_id)).where(StoreOrder.order_date >= since), set()),
+        ('store_order: orders by state',
+         select(StoreOrder.state, func.count(StoreOrder.order_id)).group_by(StoreOrder.state), set()),
+        ('store_order: orders by month',
+         select(func.strftime('%Y-%m', StoreOrder.order_date), func.count(StoreOrder.order_id))
+         .group_by(func.strftime('%Y-%m', StoreOrder.order_date)), set()),
+        ('checkout: customer of the logged in user',
+         select(Customer).where(Customer.user_id == 1), set()),
+        ('checkout: price cart products',
+         select(Product.product_id, Product.product_price).where(Product.product_id.in_([1, 2, 3])), set()),
+        ('archive: oldest orders before a date',
+         select(StoreOrder.order_id, StoreOrder.order_date).where(StoreOrder.order_date < since)
+         .order_by(StoreOrder.order_date).limit(1000), set()),
+        ('import: products by code',
+         select(Product.product_id, Product.product_code).where(Product.product_code.in_(['PROD-1', 'PROD-2'])), set()),
+        ('checkout: items of an order',
+         select(OrderItem).where(OrderItem.order_id == 1), set()),
+    ]
+
+
+def explain(connection, statement):
+    compiled = statement.compile(dialect=connection.dialect, compile_kwargs={'literal_binds': True})
+    return [each_row[-1] for each_row in connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}')]
+
+
+def is_small_table(connection, table_name, small_table_rows):
+    # Counts at most small_table_rows rows, so this stays cheap on large tables
+    if not inspect(connection).has_table(table_name):
+        return False
+    rows = connection.exec_driver_sql(
+        f'SELECT count(*) FROM (SELECT 1 FROM {table_name} LIMIT {small_table_rows})').scalar()
+    return rows < small_table_rows
+
+
+def check_query_plans(log=print, small_table_rows=SMALL_TABLE_ROWS):
+    # Returns the names of the queries that read a table without an index
+    failures = []
+
+    with db.engine.connect() as connection:
+        small_tables = {}
+        for name, statement, allow_scan in checked_queries():
+            plan = explain(connection, statement)
+            scanned = [match.group(1) for match in map(FULL_SCAN.match, plan) if match]
+            for each_table in scanned:
+                if each_table not in allow_scan and each_table not in small_tables:
+                    small_tables[each_table] = is_small_table(connection, each_table, small_table_rows)
+            full_scans = [each_table for each_table in scanned
+                          if each_table not in allow_scan and not small_tables[each_table]]
+
+            log(f'{"FULL SCAN" if full_scans else "ok":<10}{name}')
+            for each_step in plan:
+                log(f'{"":<10}  {each_step}')
+
+            if full_scans:
+                failures.append(name)
+
+    return failures
@@ -0,0 +1,277 @@
+import datetime as dt
+from sqlalchemy import func, insert, select, delete, union_all, cast, Integer
+from sqlalchemy.dialects import sqlite, postgresql
+from models import db, StoreOrder, OrderItem, Product, ProductCategory, OrderDailyRollup, ProductDailySales, \
+    OrderArchiveRollup, ProductArchiveSales, OrderArchiveHourly
+
+
+# Dialect specific INSERT constructs that support ON CONFLICT upserts
+_UPSERT_INSERTS = {
+    'sqlite': sqlite.insert,
+    'postgresql': postgresql.insert,
+}
+
+
+def _rollup_state(state):
+    # Orders without a state are counted under an empty state so they still fit the primary key
+    return state or ''
+
+
+def _rollup_date(order_date):
+    # SQLite's date() comes back as a 'YYYY-MM-DD' string
+    if isinstance(order_date, str):
+        return dt.date.fromisoformat(order_date[:10])
+    return order_date.date() if isinstance(order_date, dt.datetime) else order_date
+
+
+def record_order(store_order, session=None):
+    # Add an order to the daily rollup inside the caller's transaction
+    record_orders([store_order], session=session)
+
+
+def record_orders(store_orders, session=None):
+    session = session or db.session
+
+    counts = {}
+    for each_order in store_orders:
+        key = (_rollup_date(each_order.order_date), _rollup_state(each_order.state))
+        counts[key] = counts.get(key, 0) + 1
+
+    if not counts:
+        return
+
+    rows = [{'rollup_date': rollup_date, 'state': state, 'order_count': order_count}
+            for (rollup_date, state), order_count in counts.items()]
+
+    _upsert_increment(session, OrderDailyRollup, ['rollup_date', 'state'], ['order_count'], rows)
+
+
+def record_order_items(order_date, order_item_rows, session=None):
+    # Add an order's items (dicts with product_id, quantity and price_charged) to the daily product sales
+    session = session or db.session
+    sales_date = _rollup_date(order_date)
+
+    sales = {}
+    for each_item in order_item_rows:
+        totals = sales.setdefault(each_item['product_id'], {'sales_date': sales_date, 'product_id': each_item['product_id'],
+                                                             'quantity': 0, 'revenue': 0.0, 'order_lines': 0})
+        totals['quantity'] += each_item['quantity']
+        totals['revenue'] += each_item['price_charged']
+        totals['order_lines'] += 1
+
+    if sales:
+        _upsert_increment(session, ProductDailySales, ['sales_date', 'product_id'],
+                          ['quantity', 'revenue', 'order_lines'], list(sales.values()))
+
+
+def upsert_insert(session):
+    # The dialect's INSERT construct with ON CONFLICT support, or None
+    return _UPSERT_INSERTS.get(session.get_bind().dialect.name)
+
+
+def _upsert_increment(session, model, key_names, value_names, rows):
+    # Insert rows, or add their values to the existing row with the same key
+    dialect_insert = upsert_insert(session)
+    if dialect_insert:
+        stmt = dialect_insert(model)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[getattr(model, each_key) for each_key in key_names],
+            set_={each_value: getattr(model, each_value) + getattr(stmt.excluded, each_value) for each_value in value_names}
+        )
+        session.execute(stmt, rows)
+        return
+
+    # Fallback for databases without ON CONFLICT support
+    for row in rows:
+        rollup = session.get(model, tuple(row[each_key] for each_key in key_names))
+        if rollup:
+            for each_value in value_names:
+                setattr(rollup, each_value, getattr(rollup, each_value) + row[each_value])
+        else:
+            session.add(model(**row))
+
+
+def record_archived_orders(order_ids, session=None):
+    # Add orders that are about to be moved out of store_order (see archive.py) to the archive
+    # summaries, which stand in for them when the rollups are rebuilt
+    session = session or db.session
+
+    rollup_day = func.date(StoreOrder.order_date)
+    rollup_state = func.coalesce(StoreOrder.state, '')
+    weekday = weekday_of(StoreOrder.order_date)
+    hour = hour_of(StoreOrder.order_date)
+    archived = StoreOrder.order_id.in_(order_ids)
+
+    _upsert_increment(session, OrderArchiveRollup, ['rollup_date', 'state'], ['order_count'], [
+        {'rollup_date': _rollup_date(rollup_date), 'state': state, 'order_count': order_count}
+        for rollup_date, state, order_count in session.execute(
+            select(rollup_day, rollup_state, func.count(StoreOrder.order_id))
+            .where(archived).group_by(rollup_day, rollup_state))])
+
+    _upsert_increment(session, ProductArchiveSales, ['sales_date', 'product_id'], ['quantity', 'revenue', 'order_lines'], [
+        {'sales_date': _rollup_date(sales_date), 'product_id': product_id, 'quantity': quantity,
+         'revenue': revenue, 'order_lines': order_lines}
+        for sales_date, product_id, quantity, revenue, order_lines in session.execute(
+            select(rollup_day, OrderItem.product_id, func.sum(OrderItem.quantity),
+                   func.sum(OrderItem.price_charged), func.count(OrderItem.order_item_id))
+            .join(StoreOrder, StoreOrder.order_id == OrderItem.order_id)
+            .where(archived).group_by(rollup_day, OrderItem.product_id))])
+
+    _upsert_increment(session, OrderArchiveHourly, ['weekday', 'hour'], ['order_count'], [
+        {'weekday': each_weekday, 'hour': each_hour, 'order_count': order_count}
+        for each_weekday, each_hour, order_count in session.execute(
+            select(weekday, hour, func.count(StoreOrder.order_id))
+            .where(archived).group_by(weekday, hour))])
+
+
+def rebuild_rollups(session=None):
+    # Recompute every rollup row from store_order and order_item, one grouped pass per table,
+    # adding the archive summaries for the orders that have been moved out of them
+    session = session or db.session
+
+    rollup_day = func.date(StoreOrder.order_date)
+    rollup_state = func.coalesce(StoreOrder.state, '')
+
+    order_counts = union_all(
+        select(rollup_day.label('rollup_date'), rollup_state.label('state'), func.count(StoreOrder.order_id).label('order_count'))
+        .group_by(rollup_day, rollup_state),
+        select(OrderArchiveRollup.rollup_date, OrderArchiveRollup.state, OrderArchiveRollup.order_count)
+    ).subquery()
+
+    session.execute(delete(OrderDailyRollup))
+    session.execute(
+        insert(OrderDailyRollup).from_select(
+            ['rollup_date', 'state', 'order_count'],
+            select(order_counts.c.rollup_date, order_counts.c.state, func.sum(order_counts.c.order_count))
+            .group_by(order_counts.c.rollup_date, order_counts.c.state)
+        )
+    )
+
+    product_sales = union_all(
+        select(rollup_day.label('sales_date'), OrderItem.product_id, func.sum(OrderItem.quantity).label('quantity'),
+               func.sum(OrderItem.price_charged).label('revenue'), func.count(OrderItem.order_item_id).label('order_lines'))
+        .join(StoreOrder, StoreOrder.order_id == OrderItem.order_id)
+        .group_by(rollup_day, OrderItem.product_id),
+        select(ProductArchiveSales.sales_date, ProductArchiveSales.product_id, ProductArchiveSales.quantity,
+               ProductArchiveSales.revenue, ProductArchiveSales.order_lines)
+    ).subquery()
+
+    session.execute(delete(ProductDailySales))
+    session.execute(
+        insert(ProductDailySales).from_select(
+            ['sales_date', 'product_id', 'quantity', 'revenue', 'order_lines'],
+            select(product_sales.c.sales_date, product_sales.c.product_id, func.sum(product_sales.c.quantity),
+                   func.sum(product_sales.c.revenue), func.sum(product_sales.c.order_lines))
+            .group_by(product_sales.c.sales_date, product_sales.c.product_id)
+        )
+    )
+    session.commit()
+
+
+### Dashboard Queries ###
+# These return queries rather than rows so callers can read them straight into columnar frames
+def orders_since(days):
+    start_date = (dt.datetime.now() - dt.timedelta(days=days)).date()
+
+    return db.session.query(
+        func.coalesce(func.sum(OrderDailyRollup.order_count), 0).label('order_count')
+    ) \
+    .filter(OrderDailyRollup.rollup_date >= start_date)
+
+
+def orders_by_state():
+    return db.session.query(
+        OrderDailyRollup.state.label('states'),
+        func.sum(OrderDailyRollup.order_count).label('order_counts')
+    ) \
+    .group_by(OrderDailyRollup.state) \
+    .order_by(OrderDailyRollup.state)
+
+
+def month_of(date_column):
+    # 'YYYY-MM' for a date column, in the current database's dialect
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return func.to_char(date_column, 'YYYY-MM')
+    return func.strftime('%Y-%m', date_column)
+
+
+def weekday_of(datetime_column):
+    # 0 = Sunday ... 6 = Saturday
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return cast(func.extract('dow', datetime_column), Integer)
+    return cast(func.strftime('%w', datetime_column), Integer)
+
+
+def hour_of(datetime_column):
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return cast(func.extract('hour', datetime_column), Integer)
+    return cast(func.strftime('%H', datetime_column), Integer)
+
+
+def orders_by_month():
+    order_month = month_of(OrderDailyRollup.rollup_date).label('order_month')
+
+    return db.session.query(
+        order_month,
+        func.sum(OrderDailyRollup.order_count).label('order_counts')
+    ) \
+    .group_by(order_month) \
+    .order_by(order_month)
+
+
+### Revenue Queries ###
+# Read from product_daily_sales; start_date limits them to sales on or after that day
+def _sales_since(query, start_date):
+    if start_date:
+        query = query.filter(ProductDailySales.sales_date >= start_date)
+    return query
+
+
+def revenue_by_month(start_date=None):
+    sales_month = month_of(ProductDailySales.sales_date).label('sales_month')
+
+    return _sales_since(db.session.query(
+        sales_month,
+        func.sum(ProductDailySales.revenue).label('revenue')
+    ), start_date) \
+    .group_by(sales_month) \
+    .order_by(sales_month)
+
+
+def top_products(limit=10, start_date=None):
+    revenue = func.sum(ProductDailySales.revenue)
+
+    top_product_sales = _sales_since(db.session.query(
+        ProductDailySales.product_id.label('product_id'),
+        revenue.label('revenue'),
+        func.sum(ProductDailySales.quantity).label('quantity')
+    ), start_date) \
+    .group_by(ProductDailySales.product_id) \
+    .order_by(revenue.desc()) \
+    .limit(limit) \
+    .subquery()
+
+    # Names are looked up for the top rows only
+    return db.session.query(
+        func.coalesce(Product.product_name, 'Deleted product').label('product_name'),
+        top_product_sales.c.revenue,
+        top_product_sales.c.quantity
+    ) \
+    .select_from(top_product_sales) \
+    .outerjoin(Product, Product.product_id == top_product_sales.c.product_id) \
+    .order_by(top_product_sales.c.revenue.desc())
+
+
+def revenue_by_category(start_date=None):
+    category_name = func.coalesce(ProductCategory.category_name, 'Uncategorized').label('category_name')
+    revenue = func.sum(ProductDailySales.revenue)
+
+    return _sales_since(db.session.query(
+        category_name,
+        revenue.label('revenue')
+    ) \
+    .select_from(ProductDailySales) \
+    .outerjoin(Product, Product.product_id == ProductDailySales.product_id) \
+    .outerjoin(ProductCategory, ProductCategory.category_id == Product.category_id), start_date) \
+    .group_by(category_name) \
+    .order_by(revenue.desc())
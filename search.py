@@ -0,0 +1,103 @@
+import re
+from sqlalchemy import text, or_
+from models import db, Product
+
+
+# Full-text product search backed by an SQLite FTS5 table. The index is an external content
+# table over product, kept in sync by triggers, so product_create, product_edit and
+# product_delete (and any other writer) update it in the same transaction as the product.
+
+SEARCH_INDEX_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS product_search USING fts5(
+        product_name, product_code, product_description,
+        content='product', content_rowid='product_id', tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_insert AFTER INSERT ON product BEGIN
+        INSERT INTO product_search(rowid, product_name, product_code, product_description)
+        VALUES (new.product_id, new.product_name, new.product_code, new.product_description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_delete AFTER DELETE ON product BEGIN
+        INSERT INTO product_search(product_search, rowid, product_name, product_code, product_description)
+        VALUES ('delete', old.product_id, old.product_name, old.product_code, old.product_description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS product_search_update AFTER UPDATE ON product BEGIN
+        INSERT INTO product_search(product_search, rowid, product_name, product_code, product_description)
+        VALUES ('delete', old.product_id, old.product_name, old.product_code, old.product_description);
+        INSERT INTO product_search(rowid, product_name, product_code, product_description)
+        VALUES (new.product_id, new.product_name, new.product_code, new.product_description);
+    END
+    """,
+]
+
+# bm25 column weights: a hit in the name counts more than one in the code or description
+SEARCH_QUERY = text("""
+    SELECT rowid FROM product_search
+    WHERE product_search MATCH :match
+    ORDER BY bm25(product_search, 10.0, 5.0, 1.0)
+    LIMIT :limit OFFSET :offset
+""")
+
+
+def uses_fts():
+    return db.engine.dialect.name == 'sqlite'
+
+
+def create_search_index(rebuild=True):
+    if not uses_fts():
+        return
+
+    with db.engine.begin() as connection:
+        for each_statement in SEARCH_INDEX_DDL:
+            connection.exec_driver_sql(each_statement)
+        if rebuild:
+            connection.exec_driver_sql("INSERT INTO product_search(product_search) VALUES ('rebuild')")
+
+
+def drop_search_index():
+    if not uses_fts():
+        return
+
+    with db.engine.begin() as connection:
+        connection.exec_driver_sql('DROP TABLE IF EXISTS product_search')
+
+
+def match_expression(query):
+    # Quote every term so user input can never be read as FTS5 syntax, and prefix match the
+    # terms so partial words still find products while the customer is typing
+    terms = re.findall(r'\w+', query)
+    return ' '.join(f'"{each_term}"*' for each_term in terms)
+
+
+def search_products(query, page=1, page_size=24):
+    # Returns one page of matching products (best match first) and whether there is another page
+    match = match_expression(query)
+    if not match:
+        return [], False
+
+    offset = (page - 1) * page_size
+
+    if uses_fts():
+        product_ids = db.session.execute(SEARCH_QUERY, {'match': match, 'limit': page_size + 1, 'offset': offset}) \
+            .scalars().all()
+    else:
+        # Databases without FTS5 fall back to a (slow) substring search
+        pattern = f'%{query}%'
+        product_ids = [each_row.product_id for each_row in db.session.query(Product.product_id)
+                       .filter(or_(Product.product_name.ilike(pattern), Product.product_code.ilike(pattern),
+                                   Product.product_description.ilike(pattern)))
+                       .order_by(Product.product_name, Product.product_id)
+                       .limit(page_size + 1).offset(offset)]
+
+    has_next = len(product_ids) > page_size
+    product_ids = product_ids[:page_size]
+
+    products = {each_product.product_id: each_product
+                for each_product in Product.query.filter(Product.product_id.in_(product_ids)).all()}
+    return [products[each_id] for each_id in product_ids if each_id in products], has_next
@@ -0,0 +1,72 @@
+import threading
+import time
+from collections import OrderedDict
+from flask_login import UserMixin
+from sqlalchemy import event
+from models import User
+
+
+class CachedUser(UserMixin):
+    # Detached, read-only copy of the User columns the app reads from current_user.
+    # The password hash is deliberately left behind.
+    __slots__ = ('user_id', 'username', 'first_name', 'last_name', 'email', 'role')
+
+    def __init__(self, user):
+        self.user_id = user.user_id
+        self.username = user.username
+        self.first_name = user.first_name
+        self.last_name = user.last_name
+        self.email = user.email
+        self.role = user.role
+
+    def get_id(self):
+        return self.user_id
+
+    def __repr__(self):
+        return f"{self.first_name} {self.last_name} ({self.username})"
+
+
+class UserCache:
+    # Bounded LRU of CachedUser records with a TTL, so authenticated requests only hit the
+    # user table on a miss. Changes to User rows made through the ORM invalidate the entry
+    # in this process; the TTL bounds how long other workers can serve the old record.
+
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        event.listen(User, 'after_update', self._user_changed)
+        event.listen(User, 'after_delete', self._user_changed)
+
+    def get(self, user_id, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry and now - entry[1] < self.ttl:
+                self._entries.move_to_end(user_id)
+                return entry[0]
+
+        user = loader(user_id)
+        if user is None:
+            return None
+
+        cached_user = CachedUser(user)
+        with self._lock:
+            self._entries[user_id] = (cached_user, now)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return cached_user
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def _user_changed(self, mapper, connection, target):
+        self.invalidate(target.user_id)